@@ -1,8 +1,9 @@
 # backend/approval/approval_router.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from backend.database import get_db
-from backend.auth.jwt_utils import create_token
+from backend.auth.refresh_tokens import issue_session_tokens
+from backend.auth.user_profile import get_user_profile
 from backend.approval.approval_utils import (
     approve_request,
     reject_request
@@ -99,7 +100,7 @@ def get_approval_history(user=Depends(require_manager)):
 
 
 @router.get("/status")
-def get_approval_status(user=Depends(get_current_user)):
+def get_approval_status(request: Request, user=Depends(get_current_user)):
     db = get_db()
     cursor = db.cursor()
 
@@ -134,25 +135,24 @@ def get_approval_status(user=Depends(get_current_user)):
         if decision != "approved":
             return {"status": decision}
 
-        urow = cursor.execute(
-            "SELECT username, role FROM users WHERE id=?",
-            (user_id,),
-        ).fetchone()
+        urow = get_user_profile(user_id)
         if not urow:
             raise HTTPException(status_code=404, detail="User not found")
 
         risk = float(user.get("risk_score", 0) or 0)
-        new_token = create_token(
+        new_token, refresh_token = issue_session_tokens(
             {
                 "sub": user_id,
                 "username": urow["username"],
                 "role": urow["role"],
                 "risk_score": risk,
-            }
+            },
+            request,
         )
         return {
             "status": "approved",
             "access_token": new_token,
+            "refresh_token": refresh_token,
             "token_type": "bearer",
         }
     finally:
@@ -1,25 +1,60 @@
+import asyncio
+import json
+import time
 from datetime import datetime
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
 
 from backend.database import get_db
-from backend.auth.password_utils import verify_password
+from backend.auth.password_pool import (
+    PasswordPoolBusy,
+    schedule_rehash,
+    verify_password_async
+)
 from backend.auth.jwt_utils import create_token
 
 # 🔹 Behavior Layer
 from backend.behavior.metadata_collector import (
     collect_login_metadata,
+    fetch_geo,
     generate_device_id,
-    extract_ip_prefix
+    extract_ip_prefix,
+    parse_user_agent
 )
 from backend.behavior.behaviorhistory_logger import log_behavior_event  # FIX: renamed
-from backend.behavior.baseline_loader import load_user_baseline          # FIX: load cached baseline
+from backend.behavior.baseline_loader import (                          # FIX: load cached baseline
+    baseline_data_points,
+    load_user_baseline,
+    normalize_baseline
+)
 from backend.behavior.userbaseline_builder import build_user_baseline
+from backend.behavior.device_index import record_device_use
+from backend.behavior.cohort_baseline import COLD_START_MIN_LOGINS, with_cohort_fallback
+from backend.behavior.travel_velocity import prefetch_locations
 
 # 🔹 Security Layers
 from backend.risk_engine.risk_engine import RiskEngine
 from backend.security.stepup_engine import StepUpEngine
 from backend.approval.approval_utils import create_approval_request
 from backend.security.resource_policy import get_resource_sensitivity
+from backend.security.login_limiter import LoginThrottled, login_limiter
+from backend.security.stuffing_detector import stuffing_detector
+from backend.security.token_replay import request_fingerprint
+from backend.security.session_registry import (
+    extend_session,
+    get_session,
+    mint_session_token,
+    update_session_risk
+)
+from backend.auth.refresh_tokens import (
+    incremental_risk,
+    issue_refresh_token,
+    issue_session_tokens,
+    redeem_refresh_token,
+    request_context
+)
+from backend.config import ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_TTL_HOURS
+from backend import metrics
 
 
 router = APIRouter()
@@ -32,6 +67,9 @@ stepup_engine = StepUpEngine()
 # step-up. Using 1.0 means the raw risk score drives the decision directly.
 LOGIN_SENSITIVITY = 1.0
 
+# 🔥 Short session for monitored users
+MONITOR_SESSION_MINUTES = 30
+
 def build_pending_mfa_token(user_id: int, username: str, role: str, risk_score: float) -> str:
     return create_token(
         {
@@ -46,28 +84,32 @@ def build_pending_mfa_token(user_id: int, username: str, role: str, risk_score:
 
 
 # ==========================================
-# 🔹 Baseline Normalization
+# 🔹 LOGIN ROUTE
 # ==========================================
-def normalize_baseline(raw_baseline):
-    if not raw_baseline:
-        return {}
-
-    return {
-        "avg_login_hour": raw_baseline["temporal"]["login_hours"]["mean"],
-        "login_hour_std": raw_baseline["temporal"]["login_hours"]["std"],
-        "known_devices": raw_baseline["device"]["known_devices"],
-        "avg_session_duration": raw_baseline["session"]["avg_duration"],
-        "avg_data_transfer": raw_baseline["data"]["avg_data_transfer"],
-        "avg_download_volume": raw_baseline["data"]["avg_download_volume"]
-    }
+def _discard_stages(stages: dict):
+    """Cancel prefetch stages whose results are no longer wanted."""
+    for task in stages.values():
+        task.cancel()
+        # Retrieve any exception so asyncio doesn't log it as unhandled.
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
 
 
-# ==========================================
-# 🔹 LOGIN ROUTE
-# ==========================================
 @router.post("/api/login")
 async def login(data: dict, request: Request):
 
+    # =====================================
+    # 0️⃣ THROTTLE (before any DB or bcrypt work)
+    # =====================================
+    ip = request.client.host
+    try:
+        login_limiter.check(data.get("email"), ip)
+    except LoginThrottled as exc:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many login attempts. Try again later.",
+            headers={"Retry-After": str(exc.retry_after)}
+        )
+
     db = get_db()
     cursor = db.cursor()
 
@@ -86,13 +128,44 @@ async def login(data: dict, request: Request):
         ).fetchone()
 
         if not user:
+            login_limiter.record_failure(data["email"], ip)
+            stuffing_detector.observe(ip, data["email"])
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
         # =====================================
-        # 2️⃣ VERIFY PASSWORD
+        # 2️⃣ START PASSWORD-INDEPENDENT STAGES
+        # Geo enrichment, last-location fetch and baseline load don't depend
+        # on the password result, so they run while bcrypt verifies. Unless
+        # the password checks out, their results are discarded.
+        # =====================================
+        user_agent = request.headers.get("user-agent", "")
+        stages = {
+            "geo": asyncio.create_task(fetch_geo(ip)),
+            "locations": asyncio.create_task(asyncio.to_thread(prefetch_locations, user["id"])),
+            "baseline": asyncio.create_task(asyncio.to_thread(load_user_baseline, user["id"])),
+        }
+
+        # =====================================
+        # 3️⃣ VERIFY PASSWORD (bounded bcrypt pool)
         # =====================================
-        if not verify_password(data["password"], user["password_hash"]):
+        password_ok = False
+        try:
+            password_ok = await verify_password_async(
+                data["password"], user["password_hash"]
+            )
+        except PasswordPoolBusy as exc:
+            raise HTTPException(
+                status_code=503,
+                detail="Login service busy, retry shortly",
+                headers={"Retry-After": str(exc.retry_after)}
+            )
+        finally:
+            # Wrong password, pool busy or any other error: nothing will
+            # join the stages, so don't leave them running.
+            if not password_ok:
+                _discard_stages(stages)
 
+        if not password_ok:
             # Increment failed counter
             cursor.execute(
                 "UPDATE users SET failed_attempts = failed_attempts + 1 WHERE id=?",
@@ -106,6 +179,9 @@ async def login(data: dict, request: Request):
                 (user["id"],)
             ).fetchone()
 
+            # Memoized — repeated bad-password attempts reuse the parse.
+            device_type, os_family, browser = parse_user_agent(user_agent)
+
             # FIX: renamed log_successful_login → log_behavior_event to avoid
             # the misleading name. Same function, now named accurately.
             failed_metadata = {
@@ -115,8 +191,8 @@ async def login(data: dict, request: Request):
                 "hour": datetime.utcnow().hour,
                 "day_of_week": datetime.utcnow().weekday(),
 
-                "ip_address": request.client.host,
-                "ip_prefix": extract_ip_prefix(request.client.host),
+                "ip_address": ip,
+                "ip_prefix": extract_ip_prefix(ip),
                 "location_country": None,
                 "latitude": None,
                 "longitude": None,
@@ -124,13 +200,10 @@ async def login(data: dict, request: Request):
                 "geo_distance_km": 0,
                 "time_diff_minutes": 0,
 
-                "device_id": generate_device_id(
-                    request.headers.get("user-agent", ""),
-                    request.client.host
-                ),
-                "device_type": None,
-                "os": None,
-                "browser": None,
+                "device_id": generate_device_id(user_agent, ip),
+                "device_type": device_type,
+                "os": os_family,
+                "browser": browser,
 
                 "resource": request.url.path,
                 "action": "login_failed",
@@ -149,11 +222,13 @@ async def login(data: dict, request: Request):
             }
 
             log_behavior_event(failed_metadata)
+            login_limiter.record_failure(data["email"], ip)
+            stuffing_detector.observe(ip, data["email"])
 
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
         # =====================================
-        # 3️⃣ SUCCESSFUL LOGIN
+        # 4️⃣ SUCCESSFUL LOGIN
         # =====================================
 
         # Save previous failed attempts BEFORE reset
@@ -166,41 +241,56 @@ async def login(data: dict, request: Request):
         )
         db.commit()
 
+        login_limiter.record_success(data["email"])
+
+        # Stored hash at an outdated bcrypt cost → rehash in the background.
+        schedule_rehash(user["id"], data["password"], user["password_hash"])
+
     finally:
         # FIX: always close the DB opened at the top of the route,
         # regardless of which branch is taken (fail, success, or exception).
         db.close()
 
     # =====================================
-    # 4️⃣ COLLECT LOGIN METADATA
+    # 5️⃣ COLLECT LOGIN METADATA
+    # Joins the prefetched stages; usually already finished by now.
     # =====================================
+    geo, _, raw_baseline = await asyncio.gather(
+        stages["geo"], stages["locations"], stages["baseline"]
+    )
+
     metadata = await collect_login_metadata(
         request=request,
         user_id=user["id"],
-        username=user["username"]
+        username=user["username"],
+        geo=geo
     )
 
     # Attach historical failed count
     metadata["failed_attempts"] = previous_failed_attempts
 
     # =====================================
-    # 5️⃣ STORE LOGIN HISTORY
+    # 6️⃣ STORE LOGIN HISTORY
     # =====================================
     log_behavior_event(metadata)
 
     # =====================================
-    # 6️⃣ LOAD CACHED BASELINE (rebuild only if missing)
+    # 7️⃣ CACHED BASELINE (loaded in stage 2; rebuild only if missing
+    # or still cold-start)
     # FIX: previously called build_user_baseline() on every login, which
     # fetched 30 rows, computed stats, and wrote to DB each time.
-    # Now we load the pre-built baseline; only rebuild when absent.
+    # Now we load the pre-built baseline; only rebuild when absent, or while
+    # it has too few logins to graduate the user off the cohort baseline.
     # =====================================
-    raw_baseline = load_user_baseline(user["id"])
-    if not raw_baseline:
+    if not raw_baseline or baseline_data_points(raw_baseline) < COLD_START_MIN_LOGINS:
         raw_baseline = build_user_baseline(user["id"])
-    baseline = normalize_baseline(raw_baseline)
+    # Cold start: score against the role/site cohort until the user has
+    # enough history of their own.
+    raw_baseline = with_cohort_fallback(raw_baseline, user["role"], metadata["ip_prefix"])
+    baseline = normalize_baseline(raw_baseline, user_id=user["id"])
 
     # =====================================
-    # 7️⃣ EVALUATE RISK
+    # 8️⃣ EVALUATE RISK
     # =====================================
     risk_result = risk_engine.evaluate(metadata, baseline)
     risk_score = risk_result["score"]
@@ -211,22 +301,27 @@ async def login(data: dict, request: Request):
     action = stepup_engine.evaluate(risk_score, LOGIN_SENSITIVITY)
 
     # =====================================
-    # 8️⃣ HANDLE DECISIONS
+    # 9️⃣ HANDLE DECISIONS
     # =====================================
 
     if action == "block":
         raise HTTPException(status_code=403, detail="High Risk Login Blocked")
 
+    # Login is going through without step-up: the device is now trusted.
+    if action in ("allow", "monitor"):
+        record_device_use(user["id"], metadata["device_id"], metadata["timestamp"])
+
     if action == "monitor":
-        token = create_token({
+        token, refresh_token = issue_session_tokens({
             "sub": user["id"],
             "username": user["username"],
             "role": user["role"],
             "monitor": True,
             "risk_score": risk_score
-        }, expiry_minutes=30)      # 🔥 Short session for monitored users
+        }, request, mode="monitor", expiry_minutes=MONITOR_SESSION_MINUTES)
         return {
             "access_token": token,
+            "refresh_token": refresh_token,
             "token_type": "bearer",
             "risk_score": risk_score,
             "mode": "monitor"
@@ -295,6 +390,7 @@ async def login(data: dict, request: Request):
                 "approval_pending": True,
             },
             expiry_minutes=60,
+            fingerprint=request_fingerprint(request),
         )
         return {
             "status": "manager_approval_required",
@@ -305,16 +401,92 @@ async def login(data: dict, request: Request):
         }
 
     # Default: ALLOW
-    token = create_token({
+    token, refresh_token = issue_session_tokens({
         "sub": user["id"],
         "username": user["username"],
         "role": user["role"],
         "risk_score": risk_score
-    })
+    }, request)
 
     return {
         "access_token": token,
+        "refresh_token": refresh_token,
         "token_type": "bearer",
         "risk_score": risk_score,
         "message": "Login successful"
-    }
\ No newline at end of file
+    }
+
+# ==========================================
+# 🔹 TOKEN REFRESH ROUTE
+# ==========================================
+@router.post("/api/token/refresh")
+async def refresh_token(data: dict, request: Request):
+
+    # =====================================
+    # 1️⃣ SPEND REFRESH TOKEN
+    # =====================================
+    presented = data.get("refresh_token")
+    if not isinstance(presented, str) or not presented:
+        metrics.incr("refresh.rejected")
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+
+    try:
+        row = redeem_refresh_token(presented)
+    except PermissionError:
+        raise HTTPException(status_code=401, detail="Refresh token reuse detected; session revoked")
+    if row is None:
+        metrics.incr("refresh.rejected")
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+
+    session = get_session(row["sid"])
+    if session is None or session["revoked"]:
+        metrics.incr("refresh.rejected")
+        raise HTTPException(status_code=401, detail="Session revoked or expired")
+
+    # =====================================
+    # 2️⃣ RE-SCORE WHAT CHANGED
+    # =====================================
+    context = request_context(request)
+    risk_score, components, flags = await incremental_risk(row, context, session["risk_score"])
+    action = stepup_engine.evaluate(risk_score, LOGIN_SENSITIVITY)
+
+    if action not in ("allow", "monitor"):
+        # Keep the session's risk current so outstanding access tokens see it too.
+        update_session_risk(row["sid"], risk_score)
+        metrics.incr("refresh.stepup")
+        return JSONResponse(
+            status_code=401,
+            content={
+                "status": "reauthentication_required",
+                "action": action,
+                "risk_score": risk_score,
+                "flags": flags
+            }
+        )
+
+    # =====================================
+    # 3️⃣ ROTATE TOKENS
+    # =====================================
+    mode = "monitor" if action == "monitor" else "normal"
+    expiry_minutes = MONITOR_SESSION_MINUTES if mode == "monitor" else ACCESS_TOKEN_EXPIRE_MINUTES
+    update_session_risk(row["sid"], risk_score, mode)
+    # The session lives as long as the refresh token issued below.
+    extend_session(row["sid"], time.time() + REFRESH_TOKEN_TTL_HOURS * 3600)
+
+    claims = {"sub": row["user_id"], **json.loads(row["claims"]), "risk_score": risk_score}
+    if mode == "monitor":
+        claims["monitor"] = True
+    token = mint_session_token(claims, row["sid"], request, expiry_minutes)
+    new_refresh = issue_refresh_token(
+        row["sid"], claims, context, components,
+        family_id=row["family_id"], mode=mode
+    )
+    metrics.incr("refresh.rotated")
+
+    return {
+        "access_token": token,
+        "refresh_token": new_refresh,
+        "token_type": "bearer",
+        "risk_score": risk_score,
+        "mode": mode
+    }
@@ -1,14 +1,25 @@
 # backend/auth/jwt_utils.py
 
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from jose import jwt, JWTError, ExpiredSignatureError
 from datetime import datetime, timedelta, timezone
 from backend.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from backend.security.token_replay import is_replay
 
 
 # ==========================================================
 # 🔹 CREATE ACCESS TOKEN
 # ==========================================================
-def create_token(data: dict, expiry_minutes: int = None) -> str:
+def create_token(data: dict, expiry_minutes: int = None, fingerprint: str = None) -> str:
+    """
+    `fingerprint` (see security.token_replay.request_fingerprint) binds the
+    token to the client it was issued to; presenting it from another client
+    is flagged as token_replay.
+    """
 
     payload = data.copy()
     now = datetime.now(timezone.utc)
@@ -27,25 +38,60 @@ def create_token(data: dict, expiry_minutes: int = None) -> str:
 
     payload.update({
         "iat": iat,
-        "exp": exp
+        "exp": exp,
+        "jti": secrets.token_urlsafe(12)
     })
+    if fingerprint:
+        payload["dfp"] = fingerprint
 
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 # ==========================================================
 # 🔹 VERIFY & DECODE TOKEN
 # ==========================================================
-def verify_token(token: str) -> dict | None:
+# Verified payloads by token digest, held until the token's exp. Repeat
+# requests with the same bearer token skip signature verification.
+TOKEN_CACHE_SIZE = 4096
+
+_verified = OrderedDict()       # sha256(token) -> payload
+_verified_lock = threading.Lock()
+
+
+def _decode(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    with _verified_lock:
+        payload = _verified.get(key)
+        if payload is not None:
+            if payload.get("exp", 0) > now:
+                _verified.move_to_end(key)
+                return dict(payload)
+            del _verified[key]
+
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    with _verified_lock:
+        _verified[key] = payload
+        while len(_verified) > TOKEN_CACHE_SIZE:
+            _verified.popitem(last=False)
+    return dict(payload)
+
+
+def verify_token(token: str, fingerprint: str = None) -> dict | None:
     """
     Verifies token signature and expiration.
 
+    With `fingerprint`, also checks the token against the client it was
+    bound to / first seen from and sets payload["token_replay"] on mismatch.
+
     Returns:
         payload dict if valid
         None if invalid or expired
     """
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode(token)
+        if fingerprint and is_replay(payload, fingerprint):
+            payload["token_replay"] = True
         return payload
 
     except ExpiredSignatureError:
@@ -54,4 +100,15 @@ def verify_token(token: str) -> dict | None:
 
     except JWTError:
         # Invalid token
-        return None
\ No newline at end of file
+        return None
+
+
+def request_token_payload(request, token: str) -> dict | None:
+    """
+    Payload for `token`, reusing the one monitor_middleware already verified
+    for this request (request.state) when it is the same token.
+    """
+    state = getattr(request, "state", None)
+    if state is not None and getattr(state, "token", None) == token:
+        return state.token_payload
+    return verify_token(token)
@@ -0,0 +1,142 @@
+# backend/auth/password_pool.py
+
+"""
+Bounded executor for bcrypt work.
+
+bcrypt costs 100–300 ms of CPU per call. Running it on the event loop
+stalls every other request on the worker, and an unbounded thread queue
+lets a burst of bad-password attempts pile up behind it. Here hashing and
+verification run on a dedicated pool of PASSWORD_POOL_WORKERS threads
+(the bcrypt C extension releases the GIL), and at most
+PASSWORD_QUEUE_LIMIT calls may wait for a free thread. Beyond that,
+PasswordPoolBusy is raised and the route answers 503 with Retry-After.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import metrics
+from backend.auth.password_utils import hash_password, needs_rehash, verify_password
+from backend.database import get_db
+from backend.config import PASSWORD_POOL_WORKERS, PASSWORD_QUEUE_LIMIT
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the bcrypt queue is full; `retry_after` is in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("password verification queue is full")
+        self.retry_after = retry_after
+
+
+_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_POOL_WORKERS,
+    thread_name_prefix="bcrypt"
+)
+_lock = threading.Lock()
+_pending = 0             # queued + running
+_avg_seconds = 0.2       # moving average of one bcrypt call, for Retry-After
+
+
+def _admit():
+    global _pending
+    with _lock:
+        if _pending >= PASSWORD_POOL_WORKERS + PASSWORD_QUEUE_LIMIT:
+            metrics.incr("password.rejected")
+            # Time for the current backlog to drain through the pool.
+            drain = _pending / PASSWORD_POOL_WORKERS * _avg_seconds
+            raise PasswordPoolBusy(min(max(1, math.ceil(drain)), 60))
+        _pending += 1
+        metrics.set_gauge("password.pending", _pending)
+
+
+def _release():
+    global _pending
+    with _lock:
+        _pending -= 1
+        metrics.set_gauge("password.pending", _pending)
+
+
+def _run(fn, args, submitted):
+    global _avg_seconds
+    started = time.perf_counter()
+    metrics.observe("password.queue_wait", started - submitted)
+    try:
+        return fn(*args)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe(f"password.{fn.__name__}", elapsed)
+        _avg_seconds = 0.9 * _avg_seconds + 0.1 * elapsed
+
+
+async def _submit(fn, *args):
+    _admit()
+    try:
+        future = _executor.submit(_run, fn, args, time.perf_counter())
+    except RuntimeError:
+        _release()
+        raise
+    # Released when the thread is actually done, even if the awaiting
+    # request was cancelled meanwhile.
+    future.add_done_callback(lambda _f: _release())
+    return await asyncio.wrap_future(future)
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await _submit(verify_password, plain_password, hashed_password)
+
+
+async def hash_password_async(password) -> str:
+    return await _submit(hash_password, password)
+
+
+# ==========================================
+# 🔹 Rehash on Login
+# ==========================================
+_rehash_tasks = set()
+
+
+def _store_rehash(user_id, old_hash, new_hash) -> bool:
+    db = get_db()
+    try:
+        # Only replace the hash we verified against — a password change
+        # that landed meanwhile wins.
+        cur = db.execute(
+            "UPDATE users SET password_hash=? WHERE id=? AND password_hash=?",
+            (new_hash, user_id, old_hash)
+        )
+        db.commit()
+        return cur.rowcount > 0
+    finally:
+        db.close()
+
+
+async def _rehash(user_id, plain_password, old_hash):
+    try:
+        new_hash = await hash_password_async(plain_password)
+    except PasswordPoolBusy:
+        # Pool is saturated with logins; the next good login retries.
+        metrics.incr("password.rehash_deferred")
+        return
+    if await asyncio.to_thread(_store_rehash, user_id, old_hash, new_hash):
+        metrics.incr("password.rehashed")
+
+
+def schedule_rehash(user_id, plain_password, hashed_password) -> bool:
+    """
+    After a successful verify: if the stored hash's cost differs from the
+    configured one, rehash in the background without delaying the response.
+    """
+    if not needs_rehash(hashed_password):
+        return False
+    task = asyncio.create_task(_rehash(user_id, plain_password, hashed_password))
+    _rehash_tasks.add(task)
+    task.add_done_callback(_rehash_tasks.discard)
+    return True
+
+
+def shutdown_password_pool():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,58 @@
+import time
+from statistics import median
+
 from passlib.context import CryptContext
 
+from backend.config import BCRYPT_ROUNDS
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Security floor / sanity ceiling for bcrypt cost, whatever the hardware.
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+
+
+def configure_rounds(rounds: int):
+    """
+    Pins the bcrypt cost for new hashes. Stored hashes with any other cost
+    then report needs_update() and are rehashed on the next good login.
+    """
+    rounds = int(rounds)
+    pwd_context.update(
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds
+    )
+
+
+def calibrate_rounds(budget_ms: float, samples: int = 3) -> int:
+    """
+    Highest bcrypt cost whose verify time on this host fits in `budget_ms`
+    (never below BCRYPT_MIN_ROUNDS). Each extra round doubles the work, so
+    one cost is timed and the rest extrapolated, then the pick is checked.
+    """
+    def _time(rounds):
+        ctx = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds)
+        hashed = ctx.hash("calibration")
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            ctx.verify("calibration", hashed)
+            timings.append((time.perf_counter() - start) * 1000)
+        return median(timings)
+
+    base = BCRYPT_MIN_ROUNDS
+    rounds = base
+    base_ms = _time(base)
+    while rounds < BCRYPT_MAX_ROUNDS and base_ms * 2 ** (rounds + 1 - base) <= budget_ms:
+        rounds += 1
+
+    # Extrapolation can be off by a little (cache effects, turbo) — confirm.
+    while rounds > base and _time(rounds) > budget_ms:
+        rounds -= 1
+    return rounds
+
+
 def verify_password(plain_password, hashed_password):
     try:
         return pwd_context.verify(plain_password, hashed_password)
@@ -11,4 +62,14 @@ def verify_password(plain_password, hashed_password):
         return False
 
 def hash_password(password):
-    return pwd_context.hash(password)
\ No newline at end of file
+    return pwd_context.hash(password)
+
+def needs_rehash(hashed_password):
+    try:
+        return pwd_context.needs_update(hashed_password)
+    except Exception:
+        return False
+
+
+if BCRYPT_ROUNDS:
+    configure_rounds(BCRYPT_ROUNDS)
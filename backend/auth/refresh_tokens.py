@@ -0,0 +1,212 @@
+# backend/auth/refresh_tokens.py
+
+"""
+Rotating refresh tokens for /api/token/refresh.
+
+A refresh token is an opaque random string; only its SHA-256 is stored.
+Each use marks it spent and returns a successor in the same family. A spent
+token presented again means it was stolen (or the client raced itself):
+the whole family and its session are revoked.
+
+Alongside the token we keep the context of the last risk evaluation
+(IP prefix, device, hour) and the risk each of those contributed. A
+refresh only re-scores the dimensions that changed since, on top of the
+session's live risk, instead of running the full login pipeline.
+
+The session lives as long as its refresh-token family, so it outlasts the
+short-lived access tokens minted for it; each refresh extends it again.
+"""
+
+import hashlib
+import json
+import secrets
+import time
+from datetime import datetime
+
+from backend import metrics
+from backend.behavior.baseline_loader import load_user_baseline, normalize_baseline
+from backend.behavior.cohort_baseline import with_cohort_fallback
+from backend.behavior.device_index import is_known_device
+from backend.behavior.metadata_collector import extract_ip_prefix, fetch_geo, generate_device_id
+from backend.behavior.travel_velocity import observe_location
+from backend.config import REFRESH_TOKEN_TTL_HOURS
+from backend.database import get_db
+from backend.security.session_registry import (
+    open_request_session,
+    mint_session_token,
+    revoke_session
+)
+
+
+# Claims re-derived on every refresh rather than carried over.
+_SESSION_CLAIMS = ("sub", "sid", "risk_score", "monitor")
+
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def request_context(request) -> dict:
+    """The dimensions a refresh re-checks, taken from the current request."""
+    ip = request.client.host
+    return {
+        "ip": ip,
+        "ip_prefix": extract_ip_prefix(ip),
+        "device_id": generate_device_id(request.headers.get("user-agent", ""), ip),
+        "hour": datetime.utcnow().hour
+    }
+
+
+def issue_refresh_token(sid, claims: dict, context: dict, components: dict = None,
+                        family_id: str = None, mode: str = "normal") -> str:
+    token = secrets.token_urlsafe(32)
+    db = get_db()
+    try:
+        db.execute(
+            """
+            INSERT INTO refresh_tokens (
+                token_hash, family_id, sid, user_id, claims, mode,
+                ip_prefix, device_id, login_hour, components,
+                expires_at, used, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+            """,
+            (
+                _hash(token),
+                family_id or secrets.token_hex(8),
+                sid,
+                int(claims["sub"]),
+                json.dumps({k: v for k, v in claims.items() if k not in _SESSION_CLAIMS}),
+                mode,
+                context["ip_prefix"],
+                context["device_id"],
+                context["hour"],
+                json.dumps(components or {}),
+                time.time() + REFRESH_TOKEN_TTL_HOURS * 3600,
+                datetime.utcnow().isoformat()
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+    return token
+
+
+def issue_session_tokens(claims: dict, request, mode: str = "normal", expiry_minutes: int = None,
+                         grants: dict = None) -> tuple:
+    """
+    Opens a session; returns (access_token, refresh_token) for it. Only the
+    access token gets `expiry_minutes`; the session lasts as long as the
+    refresh token.
+    """
+    sid = open_request_session(claims, request, mode, REFRESH_TOKEN_TTL_HOURS * 60, grants)
+    access = mint_session_token(claims, sid, request, expiry_minutes)
+    context = request_context(request)
+    # The session's risk already includes this hour's login-time anomaly;
+    # record it so the first refresh subtracts it rather than adding it twice.
+    components = {
+        "hour": _hour_risk(claims["sub"], context["hour"], claims.get("role"), context["ip_prefix"])
+    }
+    refresh = issue_refresh_token(sid, claims, context, components, mode=mode)
+    return access, refresh
+
+
+def redeem_refresh_token(token: str):
+    """
+    Spends `token`. Returns its stored row, or None if unknown/expired.
+    Raises PermissionError when a spent token is replayed (family revoked).
+    """
+    token_hash = _hash(token or "")
+    db = get_db()
+    try:
+        row = db.execute(
+            "SELECT * FROM refresh_tokens WHERE token_hash=?", (token_hash,)
+        ).fetchone()
+        if not row or row["expires_at"] <= time.time():
+            return None
+
+        # Atomic spend: only one caller can flip used 0 → 1.
+        spent = db.execute(
+            "UPDATE refresh_tokens SET used=1 WHERE token_hash=? AND used=0",
+            (token_hash,)
+        ).rowcount
+        if not spent:
+            db.execute(
+                "UPDATE refresh_tokens SET used=1 WHERE family_id=?",
+                (row["family_id"],)
+            )
+        db.commit()
+    finally:
+        db.close()
+
+    if not spent:
+        revoke_session(row["sid"])
+        metrics.incr("refresh.reuse_detected")
+        raise PermissionError("refresh token reuse")
+    return row
+
+
+# ==========================================
+# 🔹 Incremental Re-evaluation
+# ==========================================
+NEW_DEVICE_RISK = 25
+NEW_PREFIX_RISK = 15
+
+
+def _prefix_seen(user_id, ip_prefix) -> bool:
+    db = get_db()
+    try:
+        row = db.execute(
+            "SELECT 1 FROM behavior_logs WHERE user_id=? AND ip_prefix=? LIMIT 1",
+            (user_id, ip_prefix)
+        ).fetchone()
+    finally:
+        db.close()
+    return row is not None
+
+
+def _hour_risk(user_id, hour, role=None, ip_prefix=None) -> float:
+    # Same baseline the login was scored against (cohort while cold-start).
+    baseline = normalize_baseline(
+        with_cohort_fallback(load_user_baseline(user_id), role, ip_prefix)
+    )
+    avg_hour = baseline.get("avg_login_hour")
+    if avg_hour is None:
+        return 0
+    # Same z-score rule as identity_risk's login-time anomaly.
+    z = abs(hour - avg_hour) / max(float(baseline.get("login_hour_std", 1)), 1.0)
+    return min(z * 10, 25) if z > 2 else 0
+
+
+async def incremental_risk(row, context: dict, session_risk: float) -> tuple:
+    """
+    Re-scores only what changed since the last evaluation recorded on the
+    refresh token. Returns (risk, components, flags).
+    """
+    user_id = row["user_id"]
+    old = json.loads(row["components"] or "{}")
+    new = dict(old)
+    flags = []
+
+    if context["device_id"] != row["device_id"]:
+        new["device"] = 0 if is_known_device(user_id, context["device_id"]) else NEW_DEVICE_RISK
+        if new["device"]:
+            flags.append("new_device")
+
+    if context["ip_prefix"] != row["ip_prefix"]:
+        geo = await fetch_geo(context["ip"])
+        travel = observe_location(user_id, datetime.utcnow(), geo.get("lat"), geo.get("lon"))
+        if travel["impossible_travel"]:
+            return 100, new, ["impossible_travel"]
+        new["network"] = 0 if _prefix_seen(user_id, context["ip_prefix"]) else NEW_PREFIX_RISK
+        if new["network"]:
+            flags.append("new_network")
+
+    if context["hour"] != row["login_hour"]:
+        role = json.loads(row["claims"] or "{}").get("role")
+        new["hour"] = _hour_risk(user_id, context["hour"], role, context["ip_prefix"])
+        if new["hour"]:
+            flags.append("login_time_anomaly")
+
+    base = max(float(session_risk or 0) - sum(old.values()), 0)
+    risk = min(base + sum(new.values()), 100)
+    return round(risk, 2), new, flags
@@ -0,0 +1,81 @@
+# backend/auth/user_profile.py
+
+"""
+Per-user profile cache: the handful of `users` columns read on the request
+path (username, email, role, MFA / biometric enrollment), without secrets.
+
+Step-up decisions and token minting after MFA read the profile from worker
+memory. Routes that change enrollment call invalidate_user_profile() right
+after their UPDATE, so this worker never serves a stale profile; other
+workers pick the change up within PROFILE_TTL_SECONDS.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from backend import metrics
+from backend.database import get_db
+
+
+# How many users' profiles stay resident in this worker.
+PROFILE_CACHE_USERS = 10000
+# Bound on how long another worker's write can go unseen here.
+PROFILE_TTL_SECONDS = 60
+
+_profiles: "OrderedDict[int, dict]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _load(user_id: int) -> dict | None:
+    db = get_db()
+    try:
+        row = db.execute(
+            """
+            SELECT id, username, email, role, mfa_secret, mfa_enabled, biometric_credential_id
+            FROM users WHERE id=?
+            """,
+            (user_id,)
+        ).fetchone()
+    finally:
+        db.close()
+    if not row:
+        return None
+    return {
+        "id": row["id"],
+        "username": row["username"],
+        "email": row["email"],
+        "role": row["role"],
+        "mfa_configured": bool(row["mfa_secret"]),
+        "mfa_enrolled": bool(row["mfa_secret"]) and int(row["mfa_enabled"] or 0) == 1,
+        "biometric_registered": row["biometric_credential_id"] is not None
+    }
+
+
+def get_user_profile(user_id) -> dict | None:
+    """Cached profile of the user, or None if there is no such user."""
+    user_id = int(user_id)
+    now = time.monotonic()
+    with _lock:
+        cached = _profiles.get(user_id)
+        if cached is not None and now - cached[0] < PROFILE_TTL_SECONDS:
+            _profiles.move_to_end(user_id)
+            metrics.incr("user_profile.hits")
+            return cached[1]
+
+    metrics.incr("user_profile.misses")
+    profile = _load(user_id)
+    if profile is None:
+        return None
+    with _lock:
+        _profiles[user_id] = (now, profile)
+        _profiles.move_to_end(user_id)
+        while len(_profiles) > PROFILE_CACHE_USERS:
+            _profiles.popitem(last=False)
+    return profile
+
+
+def invalidate_user_profile(user_id):
+    """Call after any UPDATE to the user's cached columns."""
+    with _lock:
+        _profiles.pop(int(user_id), None)
@@ -0,0 +1,113 @@
+# backend/behavior/activity_aggregator.py
+
+"""
+Aggregation of monitored-session activity in behavior_logs.
+
+Consecutive monitor_api_activity events with the same (user, session,
+resource, device, ip_prefix) inside ACTIVITY_MERGE_WINDOW_SECONDS of the row's first
+event are merged into that row: event_count grows, last_timestamp moves
+forward and data_transfer / download_volume are summed. Requests the
+monitor sampler only counted since the previous event are credited to the
+row of the resource they were for, so event_count is the number of
+requests the row stands for.
+
+Anything anomalous (impossible travel, proxy/VPN) is always written as its
+own row and never merged into, so it stays visible to the risk engine and
+the audit log.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from backend import metrics
+from backend.behavior.behaviorhistory_logger import log_behavior_event
+from backend.database import get_db
+
+
+ACTIVITY_MERGE_WINDOW_SECONDS = 300
+# Open aggregate rows tracked per worker; least recently used are closed.
+ACTIVITY_MAX_OPEN = 20000
+
+_open: "OrderedDict[tuple, list]" = OrderedDict()     # key -> [row id, first seen]
+_lock = threading.Lock()
+
+
+def _is_anomalous(metadata: dict) -> bool:
+    return bool(
+        metadata.get("impossible_travel")
+        or metadata.get("proxy_detected")
+        or metadata.get("vpn_detected")
+    )
+
+
+def _merge(row_id: int, metadata: dict, count: int) -> bool:
+    db = get_db()
+    try:
+        cur = db.execute(
+            """
+            UPDATE behavior_logs SET
+                event_count     = COALESCE(event_count, 1) + ?,
+                last_timestamp  = ?,
+                data_transfer   = COALESCE(data_transfer, 0) + ?,
+                download_volume = COALESCE(download_volume, 0) + ?
+            WHERE id=?
+            """,
+            (count, metadata["timestamp"], metadata.get("data_transfer", 0),
+             metadata.get("download_volume", 0), row_id)
+        )
+        db.commit()
+        return cur.rowcount == 1
+    finally:
+        db.close()
+
+
+def record_activity(metadata: dict) -> int:
+    """
+    Logs one monitored event, merging it into an open row when possible.
+    Returns the event's row id.
+    """
+    sampled = dict(metadata.get("sampled_resources") or {})
+    row_id = _record(metadata, 1 + int(sampled.pop(metadata["resource"], 0)))
+
+    # Counted-only requests to other resources go to those resources' rows;
+    # the transfer volumes measured belong to this event alone.
+    for resource, count in sampled.items():
+        if count:
+            _record(
+                {**metadata, "resource": resource, "data_transfer": 0, "download_volume": 0},
+                int(count)
+            )
+    return row_id
+
+
+def _record(metadata: dict, count: int) -> int:
+    key = (
+        metadata["user_id"],
+        metadata.get("session_id"),
+        metadata["resource"],
+        metadata.get("device_id"),
+        metadata.get("ip_prefix")
+    )
+    now = time.time()
+    anomalous = _is_anomalous(metadata)
+
+    if not anomalous:
+        with _lock:
+            entry = _open.get(key)
+            if entry is not None and now - entry[1] >= ACTIVITY_MERGE_WINDOW_SECONDS:
+                del _open[key]
+                entry = None
+        if entry is not None and _merge(entry[0], metadata, count):
+            metrics.incr("activity.merged")
+            return entry[0]
+
+    row_id = log_behavior_event({**metadata, "event_count": count})
+    metrics.incr("activity.rows")
+    if not anomalous:
+        with _lock:
+            _open[key] = [row_id, now]
+            _open.move_to_end(key)
+            while len(_open) > ACTIVITY_MAX_OPEN:
+                _open.popitem(last=False)
+    return row_id
@@ -0,0 +1,416 @@
+# backend/behavior/baseline_codec.py
+
+"""
+Compact binary encoding for user_baselines.
+
+Layout (all little-endian, version 1):
+
+    header      fixed struct: magic, version, numeric stats
+    histograms  24 × uint32 login-hour counts, 7 × uint32 weekday counts
+    devices     uint32 count + uint32 string ids
+    dists       5 × (uint32 count + count × (uint32 string id, uint32 n))
+    strings     uint32 count + uint32 end offsets + utf-8 blob
+
+Every string (device id, ip prefix, country, os, …) is interned once in the
+string table, so a device that shows up in known_devices and in the
+distributions is only stored once.
+
+Rows written before this format existed are plain JSON text; every reader
+here accepts both.
+"""
+
+import json
+import struct
+from array import array
+
+from backend.database import get_db
+
+
+MAGIC = b"ZTAB"
+VERSION = 1
+
+# Source log ids: magic + packed uint32 array.
+LOG_IDS_MAGIC = b"ZTAI"
+
+# Marks a None key (e.g. unknown country) in the string table slots.
+NONE_ID = 0xFFFFFFFF
+
+_HEADER = struct.Struct(
+    "<4sB3x"
+    "dddd"     # login hour mean, std, min, max
+    "d"        # vpn usage %
+    "d"        # avg session duration
+    "d"        # avg typing
+    "dd"       # avg data transfer, avg download volume
+    "d"        # avg failed attempts
+)
+
+_U32 = struct.Struct("<I")
+
+# Order matters: this is the on-disk order of the distribution sections.
+_DISTRIBUTIONS = (
+    ("network", "ip_prefix_distribution"),
+    ("network", "country_distribution"),
+    ("device", "device_type_distribution"),
+    ("device", "os_distribution"),
+    ("device", "browser_distribution"),
+)
+
+
+def _u32_array(values):
+    arr = array("I", values)
+    if arr.itemsize != 4:
+        arr = array("L", values)
+    return arr
+
+
+def _read_u32_array(buf, offset, count):
+    arr = array("I")
+    if arr.itemsize != 4:
+        arr = array("L")
+    arr.frombytes(bytes(buf[offset:offset + 4 * count]))
+    return arr
+
+
+def _json_key(key):
+    # Mirror what a json.dumps → json.loads round trip does to dict keys so
+    # decoded baselines are indistinguishable from legacy rows.
+    if key is None:
+        return "null"
+    if isinstance(key, bool):
+        return "true" if key else "false"
+    return str(key)
+
+
+# ==========================================
+# 🔹 Encoding
+# ==========================================
+def encode_baseline(baseline_data: dict) -> bytes:
+
+    temporal = baseline_data["temporal"]
+    hours = temporal["login_hours"]
+
+    strings = []
+    string_ids = {}
+
+    def intern(value):
+        if value is None:
+            return NONE_ID
+        value = str(value)
+        sid = string_ids.get(value)
+        if sid is None:
+            sid = len(strings)
+            string_ids[value] = sid
+            strings.append(value)
+        return sid
+
+    hour_hist = [0] * 24
+    for hour, count in hours["distribution"].items():
+        hour_hist[int(hour) % 24] = int(count)
+
+    day_hist = [0] * 7
+    for day, count in temporal["day_of_week_distribution"].items():
+        day_hist[int(day) % 7] = int(count)
+
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        float(hours["mean"]),
+        float(hours["std"]),
+        float(hours["min"]),
+        float(hours["max"]),
+        float(baseline_data["network"]["vpn_usage_percentage"]),
+        float(baseline_data["session"]["avg_duration"]),
+        float(baseline_data["behavior"]["avg_typing"]),
+        float(baseline_data["data"]["avg_data_transfer"]),
+        float(baseline_data["data"]["avg_download_volume"]),
+        float(baseline_data["security"]["avg_failed_attempts"]),
+    )
+
+    parts = [header, _u32_array(hour_hist).tobytes(), _u32_array(day_hist).tobytes()]
+
+    devices = [intern(d) for d in baseline_data["device"]["known_devices"]]
+    parts.append(_U32.pack(len(devices)))
+    parts.append(_u32_array(devices).tobytes())
+
+    for section, name in _DISTRIBUTIONS:
+        dist = baseline_data[section][name]
+        pairs = []
+        for key, count in dist.items():
+            pairs.append(intern(None if key == "null" else key))
+            pairs.append(int(count))
+        parts.append(_U32.pack(len(dist)))
+        parts.append(_u32_array(pairs).tobytes())
+
+    encoded = [s.encode("utf-8") for s in strings]
+    ends = []
+    total = 0
+    for raw in encoded:
+        total += len(raw)
+        ends.append(total)
+    parts.append(_U32.pack(len(encoded)))
+    parts.append(_u32_array(ends).tobytes())
+    parts.append(b"".join(encoded))
+
+    return b"".join(parts)
+
+
+def encode_log_ids(log_ids) -> bytes:
+    return LOG_IDS_MAGIC + bytes([VERSION]) + _u32_array(log_ids).tobytes()
+
+
+def decode_log_ids(value) -> list:
+    if isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:4]) == LOG_IDS_MAGIC:
+        count = (len(value) - 5) // 4
+        return list(_read_u32_array(value, 5, count))
+    if not value:
+        return []
+    return json.loads(value)
+
+
+def is_binary_baseline(value) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:4]) == MAGIC
+
+
+# ==========================================
+# 🔹 Lazy Reader
+# ==========================================
+class BaselineView:
+    """
+    Read-only view over an encoded baseline.
+
+    Only the fixed header is unpacked up front. The known-device list and the
+    distributions are decoded the first time they are asked for, and only the
+    strings they reference are pulled out of the string table.
+
+    Also behaves like the legacy nested dict (view["temporal"][...]) so older
+    call sites keep working unchanged.
+    """
+
+    __slots__ = ("_buf", "_stats", "_offsets", "_strings", "_sections", "_dict")
+
+    def __init__(self, blob):
+        buf = memoryview(blob)
+        (magic, version, *stats) = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError("Not an encoded baseline")
+        if version != VERSION:
+            raise ValueError(f"Unsupported baseline version {version}")
+        self._buf = buf
+        self._stats = stats
+        self._offsets = None
+        self._strings = {}
+        self._sections = {}
+        self._dict = None
+
+    # ---------- numeric header ----------
+    @property
+    def login_hour_mean(self):
+        return self._stats[0]
+
+    @property
+    def login_hour_std(self):
+        return self._stats[1]
+
+    @property
+    def avg_session_duration(self):
+        return self._stats[5]
+
+    @property
+    def avg_data_transfer(self):
+        return self._stats[7]
+
+    @property
+    def avg_download_volume(self):
+        return self._stats[8]
+
+    @property
+    def data_points(self):
+        return sum(_read_u32_array(self._buf, _HEADER.size, 24))
+
+    # ---------- section offsets ----------
+    def _layout(self):
+        if self._offsets is not None:
+            return self._offsets
+
+        buf = self._buf
+        pos = _HEADER.size + 4 * (24 + 7)
+
+        offsets = {"devices": pos}
+        (count,) = _U32.unpack_from(buf, pos)
+        pos += 4 + 4 * count
+
+        for _, name in _DISTRIBUTIONS:
+            offsets[name] = pos
+            (count,) = _U32.unpack_from(buf, pos)
+            pos += 4 + 8 * count
+
+        (count,) = _U32.unpack_from(buf, pos)
+        offsets["strings"] = pos
+        offsets["string_count"] = count
+        offsets["blob"] = pos + 4 + 4 * count
+
+        self._offsets = offsets
+        return offsets
+
+    def _string(self, sid):
+        if sid == NONE_ID:
+            return None
+        cached = self._strings.get(sid)
+        if cached is not None:
+            return cached
+
+        layout = self._layout()
+        table = layout["strings"] + 4
+        (end,) = _U32.unpack_from(self._buf, table + 4 * sid)
+        start = _U32.unpack_from(self._buf, table + 4 * (sid - 1))[0] if sid else 0
+        blob = layout["blob"]
+        value = bytes(self._buf[blob + start:blob + end]).decode("utf-8")
+        self._strings[sid] = value
+        return value
+
+    # ---------- variable sections ----------
+    def known_devices(self) -> list:
+        cached = self._sections.get("known_devices")
+        if cached is None:
+            pos = self._layout()["devices"]
+            (count,) = _U32.unpack_from(self._buf, pos)
+            ids = _read_u32_array(self._buf, pos + 4, count)
+            cached = [self._string(sid) for sid in ids]
+            self._sections["known_devices"] = cached
+        return cached
+
+    def distribution(self, name) -> dict:
+        cached = self._sections.get(name)
+        if cached is None:
+            pos = self._layout()[name]
+            (count,) = _U32.unpack_from(self._buf, pos)
+            pairs = _read_u32_array(self._buf, pos + 4, 2 * count)
+            cached = {
+                _json_key(self._string(pairs[i])): pairs[i + 1]
+                for i in range(0, len(pairs), 2)
+            }
+            self._sections[name] = cached
+        return cached
+
+    def _histogram(self, offset, size):
+        counts = _read_u32_array(self._buf, offset, size)
+        return {str(i): c for i, c in enumerate(counts) if c}
+
+    def summary(self) -> dict:
+        """Flat fields the risk engine reads (see normalize_baseline)."""
+        return {
+            "avg_login_hour": self.login_hour_mean,
+            "login_hour_std": self.login_hour_std,
+            "known_devices": self.known_devices(),
+            "avg_session_duration": self.avg_session_duration,
+            "avg_data_transfer": self.avg_data_transfer,
+            "avg_download_volume": self.avg_download_volume,
+        }
+
+    def to_dict(self) -> dict:
+        """Full nested baseline, same shape as the legacy JSON document."""
+        if self._dict is not None:
+            return self._dict
+
+        (h_mean, h_std, h_min, h_max, vpn_pct, avg_duration, avg_typing,
+         avg_transfer, avg_download, avg_failed) = self._stats
+        hist_pos = _HEADER.size
+
+        self._dict = {
+            "temporal": {
+                "login_hours": {
+                    "mean": h_mean,
+                    "std": h_std,
+                    "min": int(h_min),
+                    "max": int(h_max),
+                    "distribution": self._histogram(hist_pos, 24)
+                },
+                "day_of_week_distribution": self._histogram(hist_pos + 4 * 24, 7)
+            },
+            "network": {
+                "ip_prefix_distribution": self.distribution("ip_prefix_distribution"),
+                "country_distribution": self.distribution("country_distribution"),
+                "vpn_usage_percentage": vpn_pct
+            },
+            "device": {
+                "known_devices": self.known_devices(),
+                "device_type_distribution": self.distribution("device_type_distribution"),
+                "os_distribution": self.distribution("os_distribution"),
+                "browser_distribution": self.distribution("browser_distribution")
+            },
+            "session": {"avg_duration": avg_duration},
+            "behavior": {"avg_typing": avg_typing},
+            "data": {
+                "avg_data_transfer": avg_transfer,
+                "avg_download_volume": avg_download
+            },
+            "security": {"avg_failed_attempts": avg_failed}
+        }
+        return self._dict
+
+    # ---------- legacy dict access ----------
+    def __getitem__(self, key):
+        return self.to_dict()[key]
+
+    def get(self, key, default=None):
+        return self.to_dict().get(key, default)
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __bool__(self):
+        return True
+
+
+def decode_baseline(value):
+    """
+    Returns a BaselineView for binary rows and a plain dict for legacy JSON.
+    Either can be passed to normalize_baseline().
+    """
+    if value is None:
+        return None
+    if is_binary_baseline(value):
+        return BaselineView(bytes(value))
+    if isinstance(value, (bytes, bytearray)):
+        value = bytes(value).decode("utf-8")
+    return json.loads(value)
+
+
+# ==========================================
+# 🔹 Migration (JSON → binary)
+# ==========================================
+def migrate_legacy_baselines() -> int:
+    """
+    Re-encodes every JSON baseline row in place. Safe to run repeatedly;
+    rows already in the binary format are skipped. Returns rows converted.
+    """
+    db = get_db()
+    converted = 0
+    try:
+        rows = db.execute(
+            "SELECT user_id, baseline_data, source_log_ids FROM user_baselines"
+        ).fetchall()
+
+        for row in rows:
+            if is_binary_baseline(row["baseline_data"]):
+                continue
+            try:
+                baseline = json.loads(row["baseline_data"])
+                blob = encode_baseline(baseline)
+                log_ids = encode_log_ids(decode_log_ids(row["source_log_ids"]))
+            except (ValueError, KeyError, TypeError):
+                # Leave unreadable rows alone; the next rebuild overwrites them.
+                continue
+
+            db.execute(
+                "UPDATE user_baselines SET baseline_data=?, source_log_ids=? WHERE user_id=?",
+                (blob, log_ids, row["user_id"])
+            )
+            converted += 1
+
+        db.commit()
+    finally:
+        db.close()
+
+    return converted
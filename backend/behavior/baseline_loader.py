@@ -1,7 +1,12 @@
 from backend.database import get_db
-import json
+from backend.behavior.baseline_codec import decode_baseline
+from backend.behavior.device_index import known_devices
 
 def load_user_baseline(user_id):
+    """
+    Returns the cached baseline as a lazy BaselineView (binary rows) or a
+    plain dict (legacy JSON rows). Both work with normalize_baseline().
+    """
 
     db = get_db()
 
@@ -16,4 +21,50 @@ def load_user_baseline(user_id):
     if not row:
         return None
 
-    return json.loads(row["baseline_data"])
\ No newline at end of file
+    return decode_baseline(row["baseline_data"])
+
+
+def baseline_data_points(raw_baseline) -> int:
+    """Number of logins the baseline was built from (sum of the hour histogram)."""
+    if not raw_baseline:
+        return 0
+    data_points = getattr(raw_baseline, "data_points", None)
+    if data_points is not None:
+        return data_points
+    return sum(raw_baseline["temporal"]["login_hours"]["distribution"].values())
+
+
+def normalize_baseline(raw_baseline, user_id=None):
+    """
+    Flattens a stored baseline into the fields the risk engine reads.
+    Binary baselines only decode the header and known-device list here.
+
+    When user_id is given, known_devices comes from the per-user device index
+    (a set, so novelty checks are O(1) and cover more than the last 30 logins).
+    """
+    if not raw_baseline:
+        return {}
+
+    summary = getattr(raw_baseline, "summary", None)
+    if summary is not None:
+        baseline = summary()
+    else:
+        baseline = {
+            "avg_login_hour": raw_baseline["temporal"]["login_hours"]["mean"],
+            "login_hour_std": raw_baseline["temporal"]["login_hours"]["std"],
+            "known_devices": raw_baseline["device"]["known_devices"],
+            "avg_session_duration": raw_baseline["session"]["avg_duration"],
+            "avg_data_transfer": raw_baseline["data"]["avg_data_transfer"],
+            "avg_download_volume": raw_baseline["data"]["avg_download_volume"]
+        }
+
+    if user_id is not None:
+        indexed = known_devices(user_id)
+        if indexed:
+            baseline["known_devices"] = indexed
+        else:
+            # Index not populated for this user yet — fall back to the
+            # baseline's own list, as a set.
+            baseline["known_devices"] = set(baseline["known_devices"])
+
+    return baseline
@@ -37,9 +37,11 @@ def log_behavior_event(metadata: dict):
                 failed_attempts,
                 typing_avg,
                 data_transfer,
-                download_volume
+                download_volume,
+                event_count,
+                last_timestamp
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             metadata["user_id"],
             metadata["username"],
@@ -67,6 +69,8 @@ def log_behavior_event(metadata: dict):
             metadata.get("typing_avg", 0),
             metadata.get("data_transfer", 0),
             metadata.get("download_volume", 0),
+            metadata.get("event_count", 1),
+            metadata["timestamp"],
         ))
         db.commit()
         return cursor.lastrowid
@@ -0,0 +1,282 @@
+# backend/behavior/cohort_baseline.py
+
+"""
+Role / site cohort baselines for cold-start users.
+
+A user with fewer than COLD_START_MIN_LOGINS successful logins has no
+meaningful personal baseline, so they are scored against their peers:
+
+    role:<role>                  every login_success by users with that role
+    role:<role>|site:<prefix>    the same, restricted to one /24 (a site network)
+
+The site cohort is preferred when it has enough distinct members.
+
+Cohorts are kept as running accumulators (counts, sums, sums of squares,
+histograms) so a refresh only reads behavior_logs rows newer than the last
+processed id. State is persisted in cohort_baselines and loaded at startup.
+"""
+
+import asyncio
+import json
+import logging
+import math
+from datetime import datetime
+
+from backend.database import get_db
+
+
+logger = logging.getLogger("cohort_baseline")
+
+COLD_START_MIN_LOGINS = 5
+
+# A cohort is only used once it has this many distinct users / events.
+COHORT_MIN_USERS = 3
+COHORT_MIN_EVENTS = 10
+
+COHORT_REFRESH_SECONDS = 900
+
+_state: dict = {}          # cohort key -> accumulator dict
+_baselines: dict = {}      # cohort key -> derived baseline (memo)
+_watermark = 0             # highest behavior_logs.id folded in
+
+
+def _role_key(role):
+    return f"role:{role}"
+
+
+def _site_key(role, ip_prefix):
+    return f"role:{role}|site:{ip_prefix}"
+
+
+def _new_accumulator():
+    return {
+        "n": 0,
+        "hour_sum": 0.0,
+        "hour_sumsq": 0.0,
+        "hour_min": None,
+        "hour_max": None,
+        "hour_hist": [0] * 24,
+        "day_hist": [0] * 7,
+        "duration_sum": 0.0,
+        "typing_sum": 0.0,
+        "transfer_sum": 0.0,
+        "download_sum": 0.0,
+        "failed_sum": 0.0,
+        "vpn_sum": 0,
+        "users": set(),
+    }
+
+
+def _copy_accumulator(acc):
+    copy = dict(acc)
+    copy["hour_hist"] = list(acc["hour_hist"])
+    copy["day_hist"] = list(acc["day_hist"])
+    copy["users"] = set(acc["users"])
+    return copy
+
+
+def _fold(acc, row):
+    hour = int(row["hour"] or 0) % 24
+    acc["n"] += 1
+    acc["hour_sum"] += hour
+    acc["hour_sumsq"] += hour * hour
+    acc["hour_min"] = hour if acc["hour_min"] is None else min(acc["hour_min"], hour)
+    acc["hour_max"] = hour if acc["hour_max"] is None else max(acc["hour_max"], hour)
+    acc["hour_hist"][hour] += 1
+    acc["day_hist"][int(row["day_of_week"] or 0) % 7] += 1
+    acc["duration_sum"] += row["session_duration"] or 0
+    acc["typing_sum"] += row["typing_avg"] or 0
+    acc["transfer_sum"] += row["data_transfer"] or 0
+    acc["download_sum"] += row["download_volume"] or 0
+    acc["failed_sum"] += row["failed_attempts"] or 0
+    acc["vpn_sum"] += 1 if row["vpn_detected"] else 0
+    acc["users"].add(row["user_id"])
+
+
+def _to_baseline(acc) -> dict:
+    """Same nested shape as build_user_baseline(), so normalize_baseline() applies."""
+    n = acc["n"]
+    mean_hour = acc["hour_sum"] / n
+    # Sample std, matching statistics.stdev in the per-user builder.
+    var = (acc["hour_sumsq"] - n * mean_hour * mean_hour) / (n - 1) if n > 1 else 0.0
+    transfer = acc["transfer_sum"] / n
+    download = acc["download_sum"] / n
+
+    return {
+        "temporal": {
+            "login_hours": {
+                "mean": mean_hour,
+                "std": math.sqrt(max(var, 0.0)),
+                "min": acc["hour_min"],
+                "max": acc["hour_max"],
+                "distribution": {str(h): c for h, c in enumerate(acc["hour_hist"]) if c}
+            },
+            "day_of_week_distribution": {str(d): c for d, c in enumerate(acc["day_hist"]) if c}
+        },
+        "network": {
+            "ip_prefix_distribution": {},
+            "country_distribution": {},
+            "vpn_usage_percentage": acc["vpn_sum"] / n * 100
+        },
+        # Device ids are per user (UA + IP); peers' devices say nothing about
+        # whether this user's device is new.
+        "device": {
+            "known_devices": [],
+            "device_type_distribution": {},
+            "os_distribution": {},
+            "browser_distribution": {}
+        },
+        "session": {"avg_duration": acc["duration_sum"] / n},
+        "behavior": {"avg_typing": acc["typing_sum"] / n},
+        "data": {
+            "avg_data_transfer": transfer if transfer else 1,
+            "avg_download_volume": download if download else 1
+        },
+        "security": {"avg_failed_attempts": acc["failed_sum"] / n},
+        "cohort": {"members": len(acc["users"]), "events": n}
+    }
+
+
+# ==========================================
+# 🔹 Lookup
+# ==========================================
+def cohort_baseline(role, ip_prefix=None):
+    """
+    Returns the best available cohort baseline (site, then role) or None.
+    Pure in-memory lookup.
+    """
+    if not role:
+        return None
+
+    keys = [_role_key(role)]
+    if ip_prefix:
+        keys.insert(0, _site_key(role, ip_prefix))
+
+    for key in keys:
+        acc = _state.get(key)
+        if not acc or acc["n"] < COHORT_MIN_EVENTS or len(acc["users"]) < COHORT_MIN_USERS:
+            continue
+        baseline = _baselines.get(key)
+        if baseline is None:
+            baseline = _baselines[key] = _to_baseline(acc)
+        return baseline
+
+    return None
+
+
+def with_cohort_fallback(raw_baseline, role, ip_prefix=None):
+    """
+    Returns the cohort baseline instead of `raw_baseline` while the user has
+    fewer than COLD_START_MIN_LOGINS logins of their own.
+    """
+    from backend.behavior.baseline_loader import baseline_data_points
+
+    if raw_baseline and baseline_data_points(raw_baseline) >= COLD_START_MIN_LOGINS:
+        return raw_baseline
+
+    cohort = cohort_baseline(role, ip_prefix)
+    return cohort if cohort is not None else raw_baseline
+
+
+# ==========================================
+# 🔹 Batch Computation
+# ==========================================
+def load_cohort_state():
+    global _state, _baselines, _watermark
+
+    db = get_db()
+    try:
+        rows = db.execute(
+            "SELECT cohort_key, state, last_log_id FROM cohort_baselines"
+        ).fetchall()
+    finally:
+        db.close()
+
+    state = {}
+    for r in rows:
+        acc = json.loads(r["state"])
+        acc["users"] = set(acc["users"])
+        state[r["cohort_key"]] = acc
+    _state = state
+    _baselines = {}
+    _watermark = max((r["last_log_id"] for r in rows), default=0)
+
+
+def refresh_cohort_baselines(full: bool = False) -> int:
+    """
+    Folds login_success rows newer than the watermark into the cohort
+    accumulators in a single pass, then persists the cohorts that changed.
+    full=True discards the accumulators and recomputes from scratch (use after
+    bulk role changes). Returns the number of log rows processed.
+    """
+    global _state, _baselines, _watermark
+
+    # Fold into copies so request threads never see a half-updated cohort.
+    state = {} if full else dict(_state)
+    since = 0 if full else _watermark
+
+    db = get_db()
+    try:
+        rows = db.execute("""
+            SELECT
+                bl.id, bl.user_id, bl.hour, bl.day_of_week, bl.ip_prefix,
+                bl.session_duration, bl.typing_avg, bl.data_transfer,
+                bl.download_volume, bl.failed_attempts, bl.vpn_detected,
+                u.role
+            FROM behavior_logs bl
+            JOIN users u ON u.id = bl.user_id
+            WHERE bl.id > ?
+              AND bl.action = 'login_success'
+            ORDER BY bl.id
+        """, (since,)).fetchall()
+
+        changed = set()
+        watermark = since
+        for r in rows:
+            watermark = r["id"]
+            if not r["role"]:
+                continue
+            keys = [_role_key(r["role"])]
+            if r["ip_prefix"]:
+                keys.append(_site_key(r["role"], r["ip_prefix"]))
+            for key in keys:
+                if key not in changed:
+                    acc = state.get(key)
+                    state[key] = _copy_accumulator(acc) if acc else _new_accumulator()
+                    changed.add(key)
+                _fold(state[key], r)
+
+        now = datetime.utcnow().isoformat()
+        if full:
+            db.execute("DELETE FROM cohort_baselines")
+        for key in (state.keys() if full else changed):
+            acc = dict(state[key], users=sorted(state[key]["users"]))
+            db.execute("""
+                INSERT OR REPLACE INTO cohort_baselines
+                (cohort_key, state, last_log_id, member_count, last_updated)
+                VALUES (?, ?, ?, ?, ?)
+            """, (key, json.dumps(acc), watermark, len(acc["users"]), now))
+        db.commit()
+    finally:
+        db.close()
+
+    _state = state
+    _baselines = {}
+    _watermark = watermark
+    return len(rows)
+
+
+async def run_cohort_refresh_loop():
+    """Background task started from main.lifespan."""
+    try:
+        await asyncio.to_thread(load_cohort_state)
+    except Exception:
+        logger.exception("Could not load cohort baselines; rebuilding")
+
+    while True:
+        try:
+            processed = await asyncio.to_thread(refresh_cohort_baselines)
+            logger.info("Cohort baselines refreshed (%d new events)", processed)
+        except Exception:
+            logger.exception("Cohort baseline refresh failed")
+        await asyncio.sleep(COHORT_REFRESH_SECONDS)
@@ -0,0 +1,221 @@
+# backend/behavior/device_index.py
+
+"""
+Per-user known-device index.
+
+The user_devices table keeps one row per (user, device) with first/last seen
+timestamps and a use counter, so device novelty no longer depends on the
+device appearing in the last 30 logins. An in-memory set per user sits in
+front of it; membership checks are a single hash lookup regardless of how
+long the user's history is.
+
+Each cached set is re-read from the DB once it is older than
+DEVICE_REVALIDATE_SECONDS, so a device trusted on another worker becomes
+known here within that bound.
+
+Aging: devices not seen for DEVICE_MAX_AGE_DAYS stop counting as known —
+cached sets keep each device's last_seen and drop it once it passes the
+cutoff — and are purged from the DB by evict_stale_devices(). Each user keeps at most
+DEVICE_MAX_PER_USER devices (least recently seen are dropped first), which
+keeps shared kiosk accounts bounded.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from backend.database import get_db
+
+
+DEVICE_MAX_AGE_DAYS = 90
+DEVICE_MAX_PER_USER = 50
+
+# How many users' device sets stay resident in this worker.
+DEVICE_INDEX_CACHE_USERS = 10000
+# Cached sets older than this are re-read (writes from other workers).
+DEVICE_REVALIDATE_SECONDS = 5
+
+
+class _UserDevices:
+
+    __slots__ = ("devices", "last_seen", "oldest", "loaded_at")
+
+    def __init__(self, last_seen: dict):
+        self.last_seen = last_seen              # device id -> last_seen (ISO)
+        self.devices = set(last_seen)
+        self.oldest = min(last_seen.values(), default="")
+        self.loaded_at = time.monotonic()
+
+    def touch(self, device_id, timestamp: str):
+        self.last_seen[device_id] = max(timestamp, self.last_seen.get(device_id, ""))
+        self.devices.add(device_id)
+        self.oldest = min(self.last_seen.values())
+
+    def discard(self, device_id):
+        self.last_seen.pop(device_id, None)
+        self.devices.discard(device_id)
+        self.oldest = min(self.last_seen.values(), default="")
+
+    def expire(self, cutoff: str):
+        if self.oldest and self.oldest < cutoff:
+            for device_id in [d for d, seen in self.last_seen.items() if seen < cutoff]:
+                self.discard(device_id)
+
+
+_known: "OrderedDict[int, _UserDevices]" = OrderedDict()
+
+
+def _cutoff_iso(now: datetime | None = None) -> str:
+    now = now or datetime.utcnow()
+    return (now - timedelta(days=DEVICE_MAX_AGE_DAYS)).isoformat()
+
+
+def _remember(user_id: int, entry: _UserDevices) -> _UserDevices:
+    _known[user_id] = entry
+    _known.move_to_end(user_id)
+    while len(_known) > DEVICE_INDEX_CACHE_USERS:
+        _known.popitem(last=False)
+    return entry
+
+
+# ==========================================
+# 🔹 Lookups
+# ==========================================
+def _entry(user_id: int) -> _UserDevices:
+    cutoff = _cutoff_iso()
+    cached = _known.get(user_id)
+    if cached is not None and time.monotonic() - cached.loaded_at < DEVICE_REVALIDATE_SECONDS:
+        _known.move_to_end(user_id)
+        cached.expire(cutoff)
+        return cached
+
+    db = get_db()
+    try:
+        rows = db.execute("""
+            SELECT device_id, last_seen
+            FROM user_devices
+            WHERE user_id=? AND last_seen>=?
+        """, (user_id, cutoff)).fetchall()
+    finally:
+        db.close()
+
+    return _remember(user_id, _UserDevices({r["device_id"]: r["last_seen"] for r in rows}))
+
+
+def known_devices(user_id) -> set:
+    """
+    Returns the set of non-expired device ids for the user, served from
+    memory and re-read from the DB every DEVICE_REVALIDATE_SECONDS.
+    """
+    return _entry(int(user_id)).devices
+
+
+def is_known_device(user_id, device_id) -> bool:
+    return device_id in known_devices(user_id)
+
+
+# ==========================================
+# 🔹 Updates
+# ==========================================
+def record_device_use(user_id, device_id, timestamp: str | None = None):
+    """
+    Marks a device as used by the user (upsert). Call only once the device has
+    been trusted — i.e. the login was allowed or step-up was completed.
+    """
+    if not device_id:
+        return
+
+    user_id = int(user_id)
+    timestamp = timestamp or datetime.utcnow().isoformat()
+    entry = _entry(user_id)
+    is_new = device_id not in entry.devices
+
+    db = get_db()
+    try:
+        db.execute("""
+            INSERT INTO user_devices (user_id, device_id, first_seen, last_seen, use_count)
+            VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT(user_id, device_id) DO UPDATE SET
+                last_seen = excluded.last_seen,
+                use_count = use_count + 1
+        """, (user_id, device_id, timestamp, timestamp))
+
+        if is_new and len(entry.devices) + 1 > DEVICE_MAX_PER_USER:
+            # Drop the least recently seen devices beyond the per-user cap.
+            evicted = db.execute("""
+                SELECT device_id FROM user_devices
+                WHERE user_id=?
+                ORDER BY last_seen DESC
+                LIMIT -1 OFFSET ?
+            """, (user_id, DEVICE_MAX_PER_USER)).fetchall()
+            for r in evicted:
+                db.execute(
+                    "DELETE FROM user_devices WHERE user_id=? AND device_id=?",
+                    (user_id, r["device_id"])
+                )
+                entry.discard(r["device_id"])
+
+        db.commit()
+    finally:
+        db.close()
+
+    entry.touch(device_id, timestamp)
+
+
+def evict_stale_devices() -> int:
+    """Deletes devices not seen within DEVICE_MAX_AGE_DAYS. Returns rows removed."""
+    db = get_db()
+    try:
+        cursor = db.execute(
+            "DELETE FROM user_devices WHERE last_seen<?",
+            (_cutoff_iso(),)
+        )
+        db.commit()
+        removed = cursor.rowcount
+    finally:
+        db.close()
+
+    _known.clear()
+    return removed
+
+
+def forget_user_devices(user_id):
+    """Drops the in-memory set so the next lookup reloads from the DB."""
+    _known.pop(int(user_id), None)
+
+
+def untrust_device(device_id, user_id=None) -> int:
+    """
+    Removes `device_id` from the known devices of `user_id` (or of every
+    user), so its next login scores as a new device. Returns rows removed.
+    """
+    db = get_db()
+    try:
+        if user_id is None:
+            cursor = db.execute("DELETE FROM user_devices WHERE device_id=?", (device_id,))
+        else:
+            cursor = db.execute(
+                "DELETE FROM user_devices WHERE device_id=? AND user_id=?",
+                (device_id, int(user_id))
+            )
+        db.commit()
+        removed = cursor.rowcount
+    finally:
+        db.close()
+
+    if user_id is not None:
+        forget_user_devices(user_id)
+    else:
+        for cached_user in [u for u, entry in _known.items() if device_id in entry.devices]:
+            forget_user_devices(cached_user)
+    return removed
+
+
+def trust_request_device(request, user_id):
+    """Records the device behind `request` after the user completed step-up."""
+    # Imported here: metadata_collector pulls in the geo/UA stack.
+    from backend.behavior.metadata_collector import generate_device_id
+
+    ip = request.client.host if request.client else ""
+    device_id = generate_device_id(request.headers.get("user-agent", ""), ip)
+    record_device_use(user_id, device_id)
@@ -0,0 +1,124 @@
+# backend/behavior/geo_cache.py
+
+"""
+Bounded LRU cache for geo lookups, keyed by network prefix.
+
+- Keyed at GEO_CACHE_PREFIX_V4 / GEO_CACHE_PREFIX_V6 granularity, so every
+  address in a /24 that already resolved is a hit.
+- Positive answers live GEO_CACHE_TTL_SECONDS; negative answers (provider
+  knew nothing about the IP) only GEO_NEGATIVE_TTL_SECONDS.
+- At most GEO_CACHE_MAX_ENTRIES prefixes; least recently used are evicted.
+- warm_geo_cache() pre-loads prefixes already seen in behavior_logs.
+"""
+
+import time
+from collections import OrderedDict
+from ipaddress import ip_address, ip_network
+
+from backend import metrics
+from backend.config import GEO_CACHE_PREFIX_V4, GEO_CACHE_PREFIX_V6
+from backend.database import get_db
+
+
+GEO_CACHE_MAX_ENTRIES = 50000
+GEO_CACHE_TTL_SECONDS = 3600
+GEO_NEGATIVE_TTL_SECONDS = 60
+
+
+def cache_key(ip):
+    try:
+        addr = ip_address(ip)
+    except ValueError:
+        return None
+    bits = GEO_CACHE_PREFIX_V4 if addr.version == 4 else GEO_CACHE_PREFIX_V6
+    return str(ip_network(f"{addr}/{bits}", strict=False))
+
+
+def _is_positive(geo):
+    return bool(geo) and (geo.get("country") or geo.get("lat") is not None)
+
+
+class GeoCache:
+
+    def __init__(self, max_entries=GEO_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (data, expires_at)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, ip):
+        """Fresh cached geo for `ip`, or None."""
+        key = cache_key(ip)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            metrics.incr("geo.cache_misses")
+            return None
+        self._entries.move_to_end(key)
+        metrics.incr("geo.cache_hits")
+        return entry[0]
+
+    def get_stale(self, ip):
+        """Cached geo even if expired — used while the provider is unavailable."""
+        entry = self._entries.get(cache_key(ip))
+        return entry[0] if entry else None
+
+    def put(self, ip, geo, key=None):
+        key = key or cache_key(ip)
+        if key is None:
+            return
+        ttl = GEO_CACHE_TTL_SECONDS if _is_positive(geo) else GEO_NEGATIVE_TTL_SECONDS
+        self._entries[key] = (geo, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            metrics.incr("geo.cache_evictions")
+
+    def clear(self):
+        self._entries.clear()
+
+
+geo_cache = GeoCache()
+
+
+def warm_geo_cache() -> int:
+    """
+    Seeds the cache with the latest known location of every ip_prefix in
+    behavior_logs (most recent first, up to the cache size). Returns entries added.
+    """
+    db = get_db()
+    try:
+        # SQLite returns the bare columns from the row holding MAX(timestamp).
+        rows = db.execute("""
+            SELECT ip_prefix, location_country, latitude, longitude,
+                   proxy_detected, MAX(timestamp) AS last_seen
+            FROM behavior_logs
+            WHERE ip_prefix IS NOT NULL
+              AND location_country IS NOT NULL
+            GROUP BY ip_prefix
+            ORDER BY last_seen DESC
+            LIMIT ?
+        """, (geo_cache.max_entries,)).fetchall()
+    finally:
+        db.close()
+
+    added = 0
+    # Oldest first so the most recent prefixes end up most-recently-used.
+    for r in reversed(rows):
+        try:
+            network_addr = str(ip_network(r["ip_prefix"], strict=False).network_address)
+        except ValueError:
+            continue
+        key = cache_key(network_addr)
+        if key is None:
+            continue
+        geo_cache.put(network_addr, {
+            "country": r["location_country"],
+            "city": None,
+            "lat": r["latitude"],
+            "lon": r["longitude"],
+            "proxy": bool(r["proxy_detected"])
+        }, key=key)
+        added += 1
+
+    return added
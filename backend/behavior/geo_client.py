@@ -0,0 +1,173 @@
+# backend/behavior/geo_client.py
+
+"""
+Shared HTTP geo client for ip-api.com.
+
+- One long-lived httpx.AsyncClient (keep-alive connection pool), opened and
+  closed by main.lifespan.
+- Single-flight: concurrent lookups for the same network prefix (the
+  geo_cache key) await one request.
+- Circuit breaker: after repeated failures, or when the provider says we are
+  out of quota, lookups return None immediately until the cool-down passes,
+  and the caller falls back to cached/empty geo.
+"""
+
+import asyncio
+import time
+
+import httpx
+
+from backend import metrics
+from backend.behavior.geo_cache import cache_key
+
+
+GEO_API_URL = "http://ip-api.com/json/{ip}"
+GEO_TIMEOUT_SECONDS = 2.0
+GEO_MAX_CONNECTIONS = 10
+
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+
+
+class CircuitBreaker:
+    """closed → open after N consecutive failures → half_open after cool-down."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.state = "closed"
+        self.open_until = 0.0
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("geo.breaker_state", self.state)
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() >= self.open_until:
+            # Let a single probe through.
+            self.state = "half_open"
+            self._publish()
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != "closed" or self.failures:
+            self.failures = 0
+            self.state = "closed"
+            self._publish()
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.trip(self.reset_seconds)
+
+    def trip(self, seconds):
+        self.state = "open"
+        self.open_until = time.monotonic() + max(float(seconds), 1.0)
+        metrics.incr("geo.breaker_trips")
+        self._publish()
+
+
+class GeoClient:
+
+    def __init__(self):
+        self._client = None
+        self._inflight = {}
+        self.breaker = CircuitBreaker()
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=GEO_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=GEO_MAX_CONNECTIONS,
+                    max_keepalive_connections=GEO_MAX_CONNECTIONS
+                )
+            )
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def lookup(self, ip) -> dict | None:
+        """
+        Returns the provider's JSON ({} for IPs it cannot locate), or None when
+        the provider is unavailable and the caller should fall back.
+        """
+        # Coalesce at geo_cache granularity: one answer serves the whole prefix.
+        key = cache_key(ip) or ip
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.incr("geo.coalesced_waits")
+            return await asyncio.shield(task)
+
+        if not self.breaker.allow():
+            metrics.incr("geo.breaker_short_circuits")
+            return None
+
+        task = asyncio.ensure_future(self._request(ip))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _request(self, ip):
+        await self.start()
+        started = time.perf_counter()
+        try:
+            return await self._fetch(ip)
+        except Exception:
+            # Transport errors, undecodable or malformed payloads: the
+            # provider failed, the caller falls back.
+            metrics.incr("geo.provider_errors")
+            self.breaker.record_failure()
+            return None
+        finally:
+            metrics.observe("geo.provider_latency", time.perf_counter() - started)
+            # A half-open probe that ended without a verdict (e.g. cancelled)
+            # must not leave the breaker waiting on it forever.
+            if self.breaker.state == "half_open":
+                self.breaker.record_failure()
+
+    async def _fetch(self, ip):
+        response = await self._client.get(GEO_API_URL.format(ip=ip))
+
+        # ip-api.com: X-Rl = requests left in window, X-Ttl = seconds to reset.
+        remaining = response.headers.get("X-Rl")
+        reset_in = response.headers.get("X-Ttl", BREAKER_RESET_SECONDS)
+
+        if response.status_code == 429:
+            metrics.incr("geo.provider_rate_limited")
+            self.breaker.trip(_seconds(reset_in))
+            return None
+
+        if response.status_code >= 500:
+            metrics.incr("geo.provider_errors")
+            self.breaker.record_failure()
+            return None
+
+        geo = response.json()
+        status = geo.get("status")
+
+        self.breaker.record_success()
+        if remaining == "0":
+            # Quota exhausted for this window: stop before the provider bans us.
+            self.breaker.trip(_seconds(reset_in))
+
+        if status == "fail":
+            # Private/reserved address etc. — valid answer, just no location.
+            return {}
+        return geo
+
+
+def _seconds(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return BREAKER_RESET_SECONDS
+
+
+geo_client = GeoClient()
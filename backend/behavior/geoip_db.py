@@ -0,0 +1,197 @@
+# backend/behavior/geoip_db.py
+
+"""
+Offline IPv4 range → location database.
+
+The file is built by `python -m backend.scripts.build_geoip_db` and is
+memory-mapped read-only, so every uvicorn worker on the host shares the same
+page-cache pages. Lookups are a bisect over the packed range-start array plus
+one struct unpack — no network, no third party sees the user's IP.
+
+File layout (little-endian):
+
+    header   magic "ZGEO", version, range count, record count, string count
+    starts   uint32[ranges]   first address of each range (sorted)
+    ends     uint32[ranges]   last address of each range
+    recs     uint32[ranges]   record index for each range
+    records  record count × (country sid, city sid, lat, lon, proxy, asn)
+    strings  uint32 end offsets + utf-8 blob
+"""
+
+import math
+import mmap
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from ipaddress import IPv4Address, AddressValueError
+
+from backend.config import GEOIP_DB_PATH
+
+
+MAGIC = b"ZGEO"
+VERSION = 1
+
+NONE_ID = 0xFFFFFFFF
+
+HEADER = struct.Struct("<4sB3xIII")
+RECORD = struct.Struct("<IIddBxxxI")
+
+
+def ip_to_int(ip):
+    try:
+        return int(IPv4Address(ip))
+    except (AddressValueError, ValueError):
+        return None
+
+
+class GeoIPDatabase:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        buf = memoryview(self._mm)
+        magic, version, ranges, records, strings = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a v{VERSION} GeoIP database")
+
+        pos = HEADER.size
+        self._starts = self._u32(buf, pos, ranges)
+        pos += 4 * ranges
+        self._ends = self._u32(buf, pos, ranges)
+        pos += 4 * ranges
+        self._recs = self._u32(buf, pos, ranges)
+        pos += 4 * ranges
+
+        self._records_pos = pos
+        pos += RECORD.size * records
+
+        self._string_ends = self._u32(buf, pos, strings)
+        self._blob_pos = pos + 4 * strings
+        self._buf = buf
+        self.range_count = ranges
+
+    @staticmethod
+    def _u32(buf, offset, count):
+        view = buf[offset:offset + 4 * count]
+        if sys.byteorder == "little":
+            return view.cast("I")
+        # Big-endian host: copy and swap once instead of per lookup.
+        arr = array("I", bytes(view))
+        arr.byteswap()
+        return arr
+
+    def _string(self, sid):
+        if sid == NONE_ID:
+            return None
+        start = self._string_ends[sid - 1] if sid else 0
+        end = self._string_ends[sid]
+        return bytes(self._buf[self._blob_pos + start:self._blob_pos + end]).decode("utf-8")
+
+    def lookup(self, ip) -> dict | None:
+        """Returns an ip-api.com shaped dict, or None when the IP is not covered."""
+        value = ip_to_int(ip)
+        if value is None:
+            return None
+
+        i = bisect_right(self._starts, value) - 1
+        if i < 0 or value > self._ends[i]:
+            return None
+
+        country, city, lat, lon, proxy, asn = RECORD.unpack_from(
+            self._buf, self._records_pos + RECORD.size * self._recs[i]
+        )
+        return {
+            "country": self._string(country),
+            "city": self._string(city),
+            # NaN marks "no coordinates" in the file.
+            "lat": None if math.isnan(lat) else lat,
+            "lon": None if math.isnan(lon) else lon,
+            "proxy": bool(proxy),
+            "as": f"AS{asn}" if asn else None
+        }
+
+
+def _coord(value):
+    if value is None or value == "":
+        return math.nan
+    return float(value)
+
+
+def write_geoip_db(ranges, path) -> int:
+    """
+    Writes ranges to `path` in the format above.
+    `ranges` yields (start_int, end_int, country, city, lat, lon, proxy, asn).
+    Overlapping ranges are resolved in favour of the one that starts first.
+    Returns the number of ranges written.
+    """
+    strings, string_ids = [], {}
+    records, record_ids = [], {}
+    rows = []
+
+    def intern(value):
+        if not value:
+            return NONE_ID
+        sid = string_ids.get(value)
+        if sid is None:
+            sid = string_ids[value] = len(strings)
+            strings.append(value)
+        return sid
+
+    for start, end, country, city, lat, lon, proxy, asn in sorted(ranges, key=lambda r: r[0]):
+        if rows and start <= rows[-1][1]:
+            continue
+        record = (intern(country), intern(city), _coord(lat), _coord(lon),
+                  1 if proxy else 0, int(asn or 0))
+        rid = record_ids.get(record)
+        if rid is None:
+            rid = record_ids[record] = len(records)
+            records.append(record)
+        rows.append((start, end, rid))
+
+    encoded = [s.encode("utf-8") for s in strings]
+    string_ends, total = [], 0
+    for raw in encoded:
+        total += len(raw)
+        string_ends.append(total)
+
+    def packed(values):
+        return struct.pack(f"<{len(values)}I", *values)
+
+    with open(path, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, VERSION, len(rows), len(records), len(strings)))
+        fh.write(packed([r[0] for r in rows]))
+        fh.write(packed([r[1] for r in rows]))
+        fh.write(packed([r[2] for r in rows]))
+        for record in records:
+            fh.write(RECORD.pack(*record))
+        fh.write(packed(string_ends))
+        fh.write(b"".join(encoded))
+
+    return len(rows)
+
+
+# ==========================================
+# 🔹 Per-process Singleton
+# ==========================================
+_db = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def get_geoip_db() -> GeoIPDatabase | None:
+    """Opens GEOIP_DB_PATH once per process; None when not configured/present."""
+    global _db, _loaded
+    if _loaded:
+        return _db
+    with _lock:
+        if not _loaded:
+            try:
+                _db = GeoIPDatabase(GEOIP_DB_PATH) if GEOIP_DB_PATH else None
+            except (OSError, ValueError):
+                _db = None
+            _loaded = True
+    return _db
@@ -1,19 +1,19 @@
 import uuid
 import hashlib
-import httpx                          # FIX: replaced requests with httpx for async support
 import asyncio
 from datetime import datetime
+from functools import lru_cache
 from ipaddress import ip_network
-from geopy.distance import geodesic
 from user_agents import parse
-from backend.database import get_db
+from backend import metrics
+from backend.config import GEO_HTTP_FALLBACK
+from backend.behavior.geoip_db import get_geoip_db
+from backend.behavior.geo_client import geo_client
+from backend.behavior.travel_velocity import observe_location
 
-# FIX: Simple in-process geo cache so repeated lookups for the same IP
-# (especially in monitor middleware) don't fire a new HTTP call every time.
-# Cache entries expire after GEO_CACHE_TTL_SECONDS seconds.
-import time
-_geo_cache: dict = {}
-GEO_CACHE_TTL_SECONDS = 300   # 5 minutes
+# Bounded, prefix-keyed geo cache with separate positive/negative TTLs
+# (see geo_cache.py). Warmed from behavior_logs at startup.
+from backend.behavior.geo_cache import geo_cache
 
 
 def extract_ip_prefix(ip):
@@ -23,38 +23,80 @@ def extract_ip_prefix(ip):
         return None
 
 
+# The fleet sends a handful of distinct UA strings; parsing one runs a large
+# regex cascade, so results are memoized per raw UA string.
+UA_CACHE_SIZE = 1024
+# Longer strings are parsed but not cached, so junk UAs can't flush the memo.
+UA_CACHE_MAX_LENGTH = 512
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def _parse_user_agent_cached(user_agent: str) -> tuple:
+    ua = parse(user_agent)
+    return ua.device.family, ua.os.family, ua.browser.family
+
+
+def parse_user_agent(user_agent: str) -> tuple:
+    """Returns (device family, OS family, browser family)."""
+    user_agent = user_agent or ""
+    if len(user_agent) > UA_CACHE_MAX_LENGTH:
+        ua = parse(user_agent)
+        return ua.device.family, ua.os.family, ua.browser.family
+    return _parse_user_agent_cached(user_agent)
+
+
+def ua_cache_stats() -> dict:
+    info = _parse_user_agent_cached.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+
+metrics.register_collector("ua_cache", ua_cache_stats)
+
+
 def generate_device_id(user_agent, ip):
     return hashlib.sha256((user_agent + ip).encode()).hexdigest()
 
 
-async def _fetch_geo(ip: str) -> dict:
+async def fetch_geo(ip: str) -> dict:
     """
     FIX: Async geo lookup with in-memory cache.
-    - Uses httpx.AsyncClient so it never blocks the event loop.
-    - Results are cached per IP for GEO_CACHE_TTL_SECONDS to avoid hammering
+    - Served from the offline GeoIP database when ZTA_GEOIP_DB_PATH is set;
+      ip-api.com is only used without one (or with ZTA_GEO_HTTP_FALLBACK).
+    - Uses the shared httpx.AsyncClient in geo_client (pooled, single-flight,
+      circuit breaker) so it never blocks the event loop.
+    - Results are cached per network prefix (geo_cache) to avoid hammering
       ip-api.com on every monitored request (the main perf hotspot).
     """
-    now = time.monotonic()
-    cached = _geo_cache.get(ip)
-    if cached and (now - cached["ts"]) < GEO_CACHE_TTL_SECONDS:
-        return cached["data"]
-
-    try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
-            response = await client.get(f"http://ip-api.com/json/{ip}")
-            geo = response.json()
-    except Exception:
-        geo = {}
-
-    _geo_cache[ip] = {"data": geo, "ts": now}
+    # Offline database first: microseconds, no network, IP never leaves the host.
+    local_db = get_geoip_db()
+    if local_db is not None:
+        geo = local_db.lookup(ip)
+        if geo or not GEO_HTTP_FALLBACK:
+            return geo or {}
+
+    cached = geo_cache.get(ip)
+    if cached is not None:
+        return cached
+
+    # Shared pooled client; concurrent misses for one IP share a request.
+    geo = await geo_client.lookup(ip)
+    if geo is None:
+        # Provider failing or rate-limited (breaker open): answer immediately
+        # with whatever we last knew instead of waiting on the network.
+        return geo_cache.get_stale(ip) or {}
+
+    geo_cache.put(ip, geo)
     return geo
 
 
-async def collect_login_metadata(request, user_id, username):
+async def collect_login_metadata(request, user_id, username, geo=None, ua_families=None):
     """
     FIX: Now an async function so it can await the geo lookup without
     blocking the event loop (previously used synchronous requests.get()).
     Callers in auth_router and monitor_middleware must await this.
+
+    `geo` / `ua_families` may be passed in when the caller already fetched
+    them (login runs those stages concurrently with password verification).
     """
 
     now = datetime.utcnow()
@@ -62,7 +104,8 @@ async def collect_login_metadata(request, user_id, username):
     user_agent = request.headers.get("user-agent", "")
 
     # FIX: Async + cached geo lookup
-    geo = await _fetch_geo(ip)
+    if geo is None:
+        geo = await fetch_geo(ip)
 
     country = geo.get("country")
     city = geo.get("city")
@@ -70,36 +113,12 @@ async def collect_login_metadata(request, user_id, username):
     lon = geo.get("lon")
     proxy = geo.get("proxy", False)
 
-    db = get_db()
-    try:
-        # FIX: wrapped in try/finally so the connection is always closed even
-        # if an exception occurs during geo lookup or UA parse.
-        last = db.execute("""
-            SELECT timestamp, latitude, longitude
-            FROM behavior_logs
-            WHERE user_id=?
-            ORDER BY timestamp DESC
-            LIMIT 1
-        """, (user_id,)).fetchone()
-    finally:
-        db.close()
-
-    geo_distance = 0
-    time_diff = 999
-
-    if last and lat and lon and last["latitude"] and last["longitude"]:
-        last_time = datetime.fromisoformat(last["timestamp"])
-        time_diff = (now - last_time).total_seconds() / 60
-
-        try:
-            geo_distance = geodesic(
-                (lat, lon),
-                (last["latitude"], last["longitude"])
-            ).km
-        except Exception:
-            geo_distance = 0
+    # Implied speed against the user's last few locations (in-memory ring).
+    travel = observe_location(user_id, now, lat, lon)
 
-    ua = parse(user_agent)
+    if ua_families is None:
+        ua_families = parse_user_agent(user_agent)
+    device_type, os_family, browser = ua_families
 
     try:
         content_length = int(request.headers.get("content-length", 0))
@@ -125,13 +144,15 @@ async def collect_login_metadata(request, user_id, username):
         "latitude": lat,
         "longitude": lon,
 
-        "geo_distance_km": geo_distance,
-        "time_diff_minutes": time_diff,
+        "geo_distance_km": travel["geo_distance_km"],
+        "time_diff_minutes": travel["time_diff_minutes"],
+        "travel_speed_kmh": travel["travel_speed_kmh"],
+        "impossible_travel": travel["impossible_travel"],
 
         "device_id": device_id,          # FIX: single key, computed once
-        "device_type": ua.device.family,
-        "os": ua.os.family,
-        "browser": ua.browser.family,
+        "device_type": device_type,
+        "os": os_family,
+        "browser": browser,
 
         "resource": request.url.path,
         "action": "login_success",
@@ -0,0 +1,187 @@
+# backend/behavior/travel_velocity.py
+
+"""
+Impossible-travel detection from implied travel speed.
+
+For each user we keep the last TRAVEL_HISTORY_POINTS geo points in an
+in-memory ring (seeded from behavior_logs on first use). A new point is
+compared against every point in the ring with a haversine great-circle
+distance; the highest implied speed decides `impossible_travel`.
+
+Haversine on a sphere is within ~0.5% of geopy's ellipsoidal geodesic —
+far below GeoIP's own error — and costs a handful of float ops per point.
+"""
+
+import math
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from backend.database import get_db
+
+
+TRAVEL_HISTORY_POINTS = 10
+
+# Faster than a commercial flight between the two logins → impossible.
+MAX_TRAVEL_SPEED_KMH = 1000
+# GeoIP is city-level at best; ignore jumps shorter than this.
+MIN_TRAVEL_DISTANCE_KM = 500
+# Floor for elapsed time so back-to-back requests don't divide by ~0.
+MIN_ELAPSED_HOURS = 1 / 60
+
+# Users whose ring stays resident in this worker.
+TRAVEL_CACHE_USERS = 10000
+
+EARTH_RADIUS_KM = 6371.0088
+
+_rings: "OrderedDict[int, deque]" = OrderedDict()
+
+
+def _epoch(ts) -> float:
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def haversine_many(lat, lon, points) -> list:
+    """
+    Great-circle distances (km) from (lat, lon) to each (lat, lon) in `points`.
+    The origin's trig terms are computed once for the whole batch.
+    """
+    phi1 = math.radians(lat)
+    lam1 = math.radians(lon)
+    cos_phi1 = math.cos(phi1)
+    out = []
+    for plat, plon in points:
+        phi2 = math.radians(plat)
+        dphi = phi2 - phi1
+        dlam = math.radians(plon) - lam1
+        a = math.sin(dphi / 2) ** 2 + cos_phi1 * math.cos(phi2) * math.sin(dlam / 2) ** 2
+        out.append(2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a))))
+    return out
+
+
+def _evaluate(ring, ts, lat, lon) -> dict:
+    result = {
+        "geo_distance_km": 0,
+        "time_diff_minutes": 999,
+        "travel_speed_kmh": 0.0,
+        "impossible_travel": False
+    }
+    if not ring:
+        return result
+
+    distances = haversine_many(lat, lon, [(p[1], p[2]) for p in ring])
+
+    max_speed = 0.0
+    impossible = False
+    for (p_ts, _, _), km in zip(ring, distances):
+        hours = max((ts - p_ts) / 3600, MIN_ELAPSED_HOURS)
+        speed = km / hours
+        if speed > max_speed:
+            max_speed = speed
+        if km >= MIN_TRAVEL_DISTANCE_KM and speed > MAX_TRAVEL_SPEED_KMH:
+            impossible = True
+
+    # Distance/time to the most recent point, as logged in behavior_logs.
+    result["geo_distance_km"] = distances[-1]
+    result["time_diff_minutes"] = max((ts - ring[-1][0]) / 60, 0)
+    result["travel_speed_kmh"] = round(max_speed, 1)
+    result["impossible_travel"] = impossible
+    return result
+
+
+# ==========================================
+# 🔹 Per-user Ring
+# ==========================================
+def _load_ring(user_id) -> deque:
+    db = get_db()
+    try:
+        rows = db.execute("""
+            SELECT timestamp, latitude, longitude
+            FROM behavior_logs
+            WHERE user_id=?
+              AND latitude IS NOT NULL
+              AND longitude IS NOT NULL
+            ORDER BY timestamp DESC
+            LIMIT ?
+        """, (user_id, TRAVEL_HISTORY_POINTS)).fetchall()
+    finally:
+        db.close()
+
+    ring = deque(maxlen=TRAVEL_HISTORY_POINTS)
+    for r in reversed(rows):
+        try:
+            ring.append((_epoch(r["timestamp"]), float(r["latitude"]), float(r["longitude"])))
+        except (TypeError, ValueError):
+            continue
+    return ring
+
+
+def _ring(user_id) -> deque:
+    key = int(user_id)
+    ring = _rings.get(key)
+    if ring is None:
+        ring = _rings[key] = _load_ring(key)
+        while len(_rings) > TRAVEL_CACHE_USERS:
+            _rings.popitem(last=False)
+    else:
+        _rings.move_to_end(key)
+    return ring
+
+
+def prefetch_locations(user_id) -> int:
+    """
+    Loads the user's ring ahead of observe_location() (e.g. while the login
+    password is still being verified). Returns the number of points held.
+    """
+    return len(_ring(user_id))
+
+
+def observe_location(user_id, ts, lat, lon) -> dict:
+    """
+    Scores a new location against the user's recent points, then adds it to
+    the ring. Returns geo_distance_km, time_diff_minutes, travel_speed_kmh
+    and impossible_travel.
+    """
+    ring = _ring(user_id)
+    if lat is None or lon is None:
+        result = _evaluate((), 0, 0, 0)
+        if ring:
+            result["time_diff_minutes"] = max((_epoch(ts) - ring[-1][0]) / 60, 0)
+        return result
+
+    ts = _epoch(ts)
+    lat, lon = float(lat), float(lon)
+    result = _evaluate(ring, ts, lat, lon)
+    ring.append((ts, lat, lon))
+    return result
+
+
+# ==========================================
+# 🔹 Batch Evaluation
+# ==========================================
+def evaluate_batch(events) -> list:
+    """
+    Offline scoring of (user_id, timestamp, lat, lon) events, e.g. for audits
+    or seeding. Each user's events are replayed in time order with a fresh
+    ring; results come back in input order. Does not touch the live rings.
+    """
+    order = sorted(range(len(events)), key=lambda i: (events[i][0], _epoch(events[i][1])))
+    rings = {}
+    results = [None] * len(events)
+
+    for i in order:
+        user_id, ts, lat, lon = events[i]
+        ring = rings.setdefault(user_id, deque(maxlen=TRAVEL_HISTORY_POINTS))
+        if lat is None or lon is None:
+            results[i] = _evaluate((), 0, 0, 0)
+            continue
+        ts = _epoch(ts)
+        results[i] = _evaluate(ring, ts, float(lat), float(lon))
+        ring.append((ts, float(lat), float(lon)))
+
+    return results
@@ -1,8 +1,8 @@
-import json
 from statistics import mean, stdev
 from collections import Counter
 from datetime import datetime
 from backend.database import get_db
+from backend.behavior.baseline_codec import encode_baseline, encode_log_ids
 
 
 def build_user_baseline(user_id: int):
@@ -130,7 +130,7 @@ def build_user_baseline(user_id: int):
         }
     }
 
-    # Store baseline in DB
+    # Store baseline in DB (compact binary, see baseline_codec)
     db.execute("""
         INSERT OR REPLACE INTO user_baselines
         (user_id, baseline_data, last_updated,
@@ -138,10 +138,10 @@ def build_user_baseline(user_id: int):
         VALUES (?, ?, ?, ?, ?)
     """, (
         user_id,
-        json.dumps(baseline_data),
+        encode_baseline(baseline_data),
         datetime.utcnow().isoformat(),
         len(rows),
-        json.dumps(log_ids)
+        encode_log_ids(log_ids)
     ))
 
     db.commit()
@@ -3,9 +3,12 @@
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 
-from backend.auth.jwt_utils import create_token
-from backend.auth.jwt_utils import verify_token
+from backend.auth.jwt_utils import request_token_payload
 from backend.database import get_db
+from backend.behavior.device_index import trust_request_device
+from backend.auth.refresh_tokens import issue_session_tokens
+from backend.auth.user_profile import get_user_profile, invalidate_user_profile
+from backend.security.session_registry import step_up_grant
 from backend.biometric.biometric_utils import (
     create_registration_options,
     verify_registration,
@@ -75,7 +78,7 @@ def _jwt_candidates(request: Request, body_token: str | None) -> list[str]:
 def _resolve_mfa_context(request: Request, body_token: str | None) -> dict:
     last_err = "Missing biometric MFA token."
     for jwt_str in _jwt_candidates(request, body_token):
-        payload = verify_token(jwt_str)
+        payload = request_token_payload(request, jwt_str)
         if not payload:
             last_err = "Invalid or expired biometric MFA token."
             continue
@@ -176,6 +179,7 @@ def register_verify(request: Request, body: RegisterVerifyBody):
     )
     conn.commit()
     conn.close()
+    invalidate_user_profile(body.user_id)
     return {"status": "registered"}
 
 
@@ -256,12 +260,13 @@ def authenticate_verify(request: Request, body: AuthenticateVerifyBody):
         (verification.new_sign_count, body.user_id),
     )
     conn.commit()
-
-    cursor.execute("SELECT username, role FROM users WHERE id=?", (body.user_id,))
-    user_row = cursor.fetchone()
     conn.close()
 
-    token = create_token(
+    user_row = get_user_profile(body.user_id)
+
+    trust_request_device(request, body.user_id)
+
+    token, refresh_token = issue_session_tokens(
         {
             "sub": body.user_id,
             "username": user_row["username"],
@@ -270,10 +275,12 @@ def authenticate_verify(request: Request, body: AuthenticateVerifyBody):
             # Preserve original pending risk so subsequent step-up enforcement
             # remains consistent after strong MFA.
             "risk_score": float(context.get("risk_score", 0) or 0),
-        }
+        },
+        request,
+        grants=step_up_grant("strong_mfa", context.get("resource"))
     )
 
-    return {"status": "verified", "access_token": token}
+    return {"status": "verified", "access_token": token, "refresh_token": refresh_token}
 
 
 @router.post("/biometric/status")
@@ -281,17 +288,9 @@ def biometric_status(request: Request, body: StatusBody):
     context = _resolve_mfa_context(request, body.mfa_context_token)
     _assert_token_user_match(context, body.user_id)
 
-    conn = get_db()
-    cursor = conn.cursor()
-    row = cursor.execute(
-        "SELECT biometric_credential_id FROM users WHERE id=?",
-        (body.user_id,),
-    ).fetchone()
-    conn.close()
-
-    if not row:
+    profile = get_user_profile(body.user_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="User not found")
 
-    registered = row["biometric_credential_id"] is not None
-    return {"registered": bool(registered)}
+    return {"registered": profile["biometric_registered"]}
 
@@ -19,4 +19,59 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 LOW_RISK = 30
-HIGH_RISK = 70
\ No newline at end of file
+HIGH_RISK = 70
+
+# Offline GeoIP database built with `python -m backend.scripts.build_geoip_db`.
+# When set, geo enrichment never leaves the host.
+GEOIP_DB_PATH = os.environ.get("ZTA_GEOIP_DB_PATH", "")
+
+# Query ip-api.com for IPs the offline database does not cover.
+GEO_HTTP_FALLBACK = os.environ.get("ZTA_GEO_HTTP_FALLBACK", "false").lower() in ("1", "true", "yes")
+
+# Geo cache granularity: lookups are shared by every address in the prefix.
+GEO_CACHE_PREFIX_V4 = int(os.environ.get("ZTA_GEO_CACHE_PREFIX_V4", "24"))
+GEO_CACHE_PREFIX_V6 = int(os.environ.get("ZTA_GEO_CACHE_PREFIX_V6", "48"))
+
+
+# bcrypt runs on its own thread pool; at most this many logins may queue
+# for a free thread before /api/login answers 503.
+PASSWORD_POOL_WORKERS = int(os.environ.get("ZTA_PASSWORD_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_QUEUE_LIMIT = int(os.environ.get("ZTA_PASSWORD_QUEUE_LIMIT", "32"))
+
+# bcrypt cost for new hashes. Pick it per host with
+# `python -m backend.scripts.calibrate_bcrypt`; 0 keeps passlib's default.
+# Stored hashes at another cost are rehashed on the next successful login.
+BCRYPT_ROUNDS = int(os.environ.get("ZTA_BCRYPT_ROUNDS", "0"))
+# Per-verify budget used by calibration.
+BCRYPT_VERIFY_BUDGET_MS = float(os.environ.get("ZTA_BCRYPT_VERIFY_BUDGET_MS", "250"))
+# Calibrate at startup when ZTA_BCRYPT_ROUNDS is unset. Only safe when every
+# worker runs on identical hardware, otherwise workers disagree on the cost
+# and keep rehashing each other's hashes.
+BCRYPT_CALIBRATE_ON_STARTUP = os.environ.get("ZTA_BCRYPT_CALIBRATE_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+# Login throttling state: "memory" (per worker) or "sqlite" (shared by all
+# workers on the host, one small write per failed login).
+LOGIN_LIMITER_BACKEND = os.environ.get("ZTA_LOGIN_LIMITER_BACKEND", "memory").lower()
+# Lockout durations (seconds) for the 1st, 2nd, 3rd… lockout of the same
+# account/IP/prefix within a day.
+LOGIN_LOCKOUT_SCHEDULE = [
+    int(s) for s in os.environ.get("ZTA_LOGIN_LOCKOUT_SCHEDULE", "60,300,900,3600").split(",") if s.strip()
+]
+
+# Lifetime of a refresh-token family: one clinical shift by default.
+REFRESH_TOKEN_TTL_HOURS = float(os.environ.get("ZTA_REFRESH_TOKEN_TTL_HOURS", "12"))
+
+# How long a completed MFA / strong MFA satisfies step-up for the same
+# resource class in the same session.
+STEPUP_GRANT_TTL_SECONDS = int(os.environ.get("ZTA_STEPUP_GRANT_TTL_SECONDS", "900"))
+
+# Monitored sessions: full risk re-evaluation at most this often, or every N
+# requests, unless the IP prefix / device / sensitivity class changes.
+MONITOR_REEVAL_INTERVAL_SECONDS = float(os.environ.get("ZTA_MONITOR_REEVAL_INTERVAL_SECONDS", "30"))
+MONITOR_REEVAL_EVERY_N = int(os.environ.get("ZTA_MONITOR_REEVAL_EVERY_N", "20"))
+
+# Monitored sessions re-evaluate in a background queue and enforce the
+# outcome on the next request; resources at or above this sensitivity are
+# still re-evaluated inline.
+MONITOR_DEFERRED = os.environ.get("ZTA_MONITOR_DEFERRED", "true").lower() in ("1", "true", "yes")
+MONITOR_SYNC_SENSITIVITY = float(os.environ.get("ZTA_MONITOR_SYNC_SENSITIVITY", "0.7"))
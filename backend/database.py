@@ -53,6 +53,109 @@ def create_tables():
             """
         )
 
+        # Per-user known-device index (see behavior/device_index.py).
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_devices (
+                user_id INTEGER NOT NULL,
+                device_id TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                use_count INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (user_id, device_id)
+            )
+            """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_user_devices_last_seen ON user_devices (user_id, last_seen)"
+        )
+
+        # Backfill the device index from login history the first time it exists.
+        try:
+            if cur.execute("SELECT 1 FROM user_devices LIMIT 1").fetchone() is None:
+                cur.execute(
+                    """
+                    INSERT OR IGNORE INTO user_devices
+                        (user_id, device_id, first_seen, last_seen, use_count)
+                    SELECT user_id, device_id, MIN(timestamp), MAX(timestamp), COUNT(*)
+                    FROM behavior_logs
+                    WHERE action = 'login_success' AND device_id IS NOT NULL
+                    GROUP BY user_id, device_id
+                    """
+                )
+        except sqlite3.OperationalError:
+            pass
+
+        # Role/site peer baselines for cold-start users (see behavior/cohort_baseline.py).
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cohort_baselines (
+                cohort_key TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                last_log_id INTEGER NOT NULL DEFAULT 0,
+                member_count INTEGER NOT NULL DEFAULT 0,
+                last_updated TEXT NOT NULL
+            )
+            """
+        )
+
+        # Login throttling state shared across workers (see security/login_limiter.py,
+        # only used when ZTA_LOGIN_LIMITER_BACKEND=sqlite).
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS login_limits (
+                limit_key TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                curr INTEGER NOT NULL DEFAULT 0,
+                prev INTEGER NOT NULL DEFAULT 0,
+                locked_until REAL NOT NULL DEFAULT 0,
+                lock_level INTEGER NOT NULL DEFAULT 0,
+                last_lock REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+
+        # Server-side sessions behind the JWT `sid` claim (see security/session_registry.py).
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                device_id TEXT,
+                risk_score REAL NOT NULL DEFAULT 0,
+                mode TEXT NOT NULL DEFAULT 'normal',
+                grants TEXT NOT NULL DEFAULT '{}',
+                revoked INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_device ON sessions(device_id)")
+
+        # Rotating refresh tokens (see auth/refresh_tokens.py). Only hashes are stored.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS refresh_tokens (
+                token_hash TEXT PRIMARY KEY,
+                family_id TEXT NOT NULL,
+                sid TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                claims TEXT NOT NULL,
+                mode TEXT NOT NULL DEFAULT 'normal',
+                ip_prefix TEXT,
+                device_id TEXT,
+                login_hour INTEGER,
+                components TEXT NOT NULL DEFAULT '{}',
+                expires_at REAL NOT NULL,
+                used INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family ON refresh_tokens(family_id)")
+
         # Add biometric columns to users table if missing.
         # SQLite has no IF NOT EXISTS for ADD COLUMN; we ignore "duplicate column" errors.
         user_cols = [
@@ -67,6 +170,13 @@ def create_tables():
             except sqlite3.OperationalError:
                 pass
 
+        # Aggregated activity rows (see behavior/activity_aggregator.py).
+        for col, col_type in (("event_count", "INTEGER NOT NULL DEFAULT 1"), ("last_timestamp", "TEXT")):
+            try:
+                cur.execute(f"ALTER TABLE behavior_logs ADD COLUMN {col} {col_type}")
+            except sqlite3.OperationalError:
+                pass
+
         # If the DB previously stored a platform-auth credential under older column names,
         # copy it forward once so existing enrollments continue working.
         try:
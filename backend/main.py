@@ -1,12 +1,25 @@
+import asyncio
 from pathlib import Path
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 from backend.auth.auth_router import router as auth_router
 from backend.database import create_tables
+from backend.behavior.baseline_codec import migrate_legacy_baselines
+from backend.behavior.device_index import evict_stale_devices
+from backend.behavior.cohort_baseline import run_cohort_refresh_loop
+from backend.behavior.geo_client import geo_client
+from backend.behavior.geo_cache import warm_geo_cache
+from backend.auth.password_pool import shutdown_password_pool
+from backend.security.session_registry import purge_expired_sessions
+from backend.security.monitor_queue import deferred_monitor
+from backend.auth.password_utils import calibrate_rounds, configure_rounds
+from backend.config import BCRYPT_CALIBRATE_ON_STARTUP, BCRYPT_ROUNDS, BCRYPT_VERIFY_BUDGET_MS
+from backend import metrics
+from backend.security.auth_dependencies import require_manager
 from fastapi.middleware.cors import CORSMiddleware
 
-from backend.security.monitor_middleware import monitor_middleware
+from backend.security.monitor_middleware import MonitorMiddleware
 
 from backend.routers.admin_router import router as admin_router
 from backend.approval.approval_router import router as approval_router
@@ -22,9 +35,28 @@ from backend.biometric.biometric_router import router as biometric_router
 async def lifespan(app: FastAPI):
     # 🔹 Startup logic
     create_tables()
+    # Re-encode any JSON baselines left from older builds (no-op once done).
+    migrate_legacy_baselines()
+    evict_stale_devices()
+    purge_expired_sessions()
+    # Cohort baselines: one batch pass now, then incremental refreshes.
+    cohort_task = asyncio.create_task(run_cohort_refresh_loop())
+    # One pooled HTTP client for geo lookups for the whole worker.
+    await geo_client.start()
+    # Pre-load locations for networks we have already seen.
+    await asyncio.to_thread(warm_geo_cache)
+    # Deferred re-evaluation for monitored sessions.
+    deferred_monitor.start()
+    if BCRYPT_CALIBRATE_ON_STARTUP and not BCRYPT_ROUNDS:
+        rounds = await asyncio.to_thread(calibrate_rounds, BCRYPT_VERIFY_BUDGET_MS)
+        configure_rounds(rounds)
+        metrics.set_gauge("password.bcrypt_rounds", rounds)
     yield
-    # 🔹 Shutdown logic (optional)
-    # You can close connections or cleanup here
+    # 🔹 Shutdown logic
+    cohort_task.cancel()
+    await deferred_monitor.stop()
+    await geo_client.aclose()
+    shutdown_password_pool()
 
 
 app = FastAPI(
@@ -33,7 +65,7 @@ app = FastAPI(
 )
 
 # Activate adaptive monitoring
-app.middleware("http")(monitor_middleware)
+app.add_middleware(MonitorMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -62,6 +94,11 @@ if FRONTEND_DIR.is_dir():
 def root():
     return {"status": "ZTA Backend Running"}
 
+@app.get("/api/metrics")
+def get_metrics(user=Depends(require_manager)):
+    # Per-worker counters/latencies (geo provider, breaker state, ...).
+    return metrics.snapshot()
+
 @app.get("/")
 def frontend_root():
     # convenience: open base URL and land on login
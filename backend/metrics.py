@@ -0,0 +1,78 @@
+# backend/metrics.py
+
+"""
+Minimal in-process metrics: counters, gauges and latency summaries.
+
+Per worker, no external dependency. Read with snapshot() (served on
+GET /api/metrics for managers). Modules that already keep their own stats
+(e.g. an lru_cache) can expose them with register_collector().
+"""
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_timings = {}
+_collectors = {}
+
+
+def incr(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] += amount
+
+
+def set_gauge(name: str, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float):
+    """Records one latency sample (seconds)."""
+    with _lock:
+        t = _timings.get(name)
+        if t is None:
+            t = _timings[name] = {"count": 0, "total": 0.0, "max": 0.0}
+        t["count"] += 1
+        t["total"] += seconds
+        if seconds > t["max"]:
+            t["max"] = seconds
+
+
+def register_collector(name: str, fn):
+    """`fn()` is called on every snapshot and its dict reported under `name`."""
+    _collectors[name] = fn
+
+
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot() -> dict:
+    with _lock:
+        timings = {
+            name: {
+                "count": t["count"],
+                "avg_ms": round(1000 * t["total"] / t["count"], 3) if t["count"] else 0,
+                "max_ms": round(1000 * t["max"], 3)
+            }
+            for name, t in _timings.items()
+        }
+        result = {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": timings
+        }
+
+    for name, fn in list(_collectors.items()):
+        result[name] = fn()
+    return result
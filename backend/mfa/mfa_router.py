@@ -2,14 +2,16 @@
 
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from datetime import datetime, timedelta
-import random
 
 from backend.database import get_db
-from backend.auth.jwt_utils import create_token, verify_token
+from backend.auth.jwt_utils import request_token_payload
 from backend.mfa.mfa_utils import generate_secret, generate_qr, verify_totp
-from backend.auth.password_utils import hash_password, verify_password
+from backend.mfa.otp_engine import issue_challenge, verify_challenge
 from backend.notifications.email_utils import send_email_otp
+from backend.behavior.device_index import trust_request_device
+from backend.auth.refresh_tokens import issue_session_tokens
+from backend.auth.user_profile import get_user_profile, invalidate_user_profile
+from backend.security.session_registry import step_up_grant
 
 router = APIRouter()
 
@@ -69,7 +71,7 @@ def _jwt_candidates(request: Request, body_token: str | None) -> list[str]:
 def _resolve_mfa_context(request: Request, body_token: str | None) -> dict:
     last_err = "Missing MFA token."
     for jwt_str in _jwt_candidates(request, body_token):
-        payload = verify_token(jwt_str)
+        payload = request_token_payload(request, jwt_str)
         if not payload:
             last_err = "Invalid or expired MFA token."
             continue
@@ -126,6 +128,7 @@ def setup_mfa(request: Request, body: SetupBody):
             (secret, user_id)
         )
         conn.commit()
+        invalidate_user_profile(user_id)
 
     conn.close()
 
@@ -174,22 +177,26 @@ def verify_mfa(request: Request, body: VerifyBody):
     if int(row["mfa_enabled"] or 0) == 0:
         cursor.execute("UPDATE users SET mfa_enabled=1 WHERE id=?", (user_id,))
         conn.commit()
+        invalidate_user_profile(user_id)
 
     conn.close()
 
+    # Completed step-up: this device no longer counts as new for the user.
+    trust_request_device(request, user_id)
+
     # FIX: preserve risk_score in the post-MFA token.
     # Previously create_token() was called without risk_score, so the new JWT
     # had risk_score=None, making the user appear risk-free after MFA and
     # bypassing all subsequent step-up checks in require_role_access().
-    token = create_token({
+    token, refresh_token = issue_session_tokens({
         "sub": user_id,
         "username": row["username"],
         "role": row["role"],
         "mfa": True,
         "risk_score": float(context.get("risk_score", body.risk_score))
-    })
+    }, request, grants=step_up_grant("mfa", context.get("resource")))
 
-    return {"access_token": token}
+    return {"access_token": token, "refresh_token": refresh_token}
 
 
 # ============================================================
@@ -204,44 +211,14 @@ def request_email_otp(request: Request, body: EmailOtpRequestBody):
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid MFA token.")
 
-    conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT email, username, role FROM users WHERE id=?",
-        (user_id,)
-    )
-    row = cursor.fetchone()
+    row = get_user_profile(user_id)
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="User not found")
     if not row["email"]:
-        conn.close()
         raise HTTPException(status_code=400, detail="User has no email configured.")
 
-    otp = str(random.randint(100000, 999999))
-    otp_hash = hash_password(otp)
-
-    now = datetime.utcnow()
-    expires_at = (now + timedelta(minutes=5)).isoformat()
-    created_at = now.isoformat()
-
-    # Invalidate previous unused challenges.
-    cursor.execute(
-        "UPDATE email_otp_challenges SET consumed=1 WHERE user_id=? AND consumed=0",
-        (user_id,)
-    )
-
-    cursor.execute(
-        """
-        INSERT INTO email_otp_challenges (
-            user_id, otp_hash, expires_at, created_at, consumed, attempt_count
-        ) VALUES (?, ?, ?, ?, 0, 0)
-        """,
-        (user_id, otp_hash, expires_at, created_at)
-    )
-    conn.commit()
-    conn.close()
+    # HMAC challenge held in memory; the DB row is audit only.
+    otp = issue_challenge(user_id)
 
     try:
         send_result = send_email_otp(row["email"], otp)
@@ -270,58 +247,27 @@ def verify_email_otp(request: Request, body: EmailOtpVerifyBody):
     if not otp.isdigit() or len(otp) != 6:
         raise HTTPException(status_code=400, detail="OTP must be a 6-digit number.")
 
-    conn = get_db()
-    cursor = conn.cursor()
-
-    now = datetime.utcnow().isoformat()
-    cursor.execute(
-        """
-        SELECT id, otp_hash
-        FROM email_otp_challenges
-        WHERE user_id=? AND consumed=0 AND expires_at>?
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
-        (user_id, now)
-    )
-    row = cursor.fetchone()
-    if not row:
-        conn.close()
+    outcome = verify_challenge(user_id, otp)
+    if outcome == "expired":
         raise HTTPException(status_code=400, detail="Email OTP expired or not requested.")
-
-    if not verify_password(otp, row["otp_hash"]):
-        cursor.execute(
-            "UPDATE email_otp_challenges SET attempt_count=attempt_count+1 WHERE id=?",
-            (row["id"],)
-        )
-        conn.commit()
-        conn.close()
+    if outcome == "locked":
+        raise HTTPException(status_code=429, detail="Too many attempts. Request a new code.")
+    if outcome != "ok":
         raise HTTPException(status_code=401, detail="Invalid OTP")
 
-    cursor.execute(
-        "UPDATE email_otp_challenges SET consumed=1 WHERE id=?",
-        (row["id"],)
-    )
-
-    cursor.execute(
-        "SELECT username, role FROM users WHERE id=?",
-        (user_id,)
-    )
-    user_row = cursor.fetchone()
-
-    conn.commit()
-    conn.close()
-
+    user_row = get_user_profile(user_id)
     if not user_row:
         raise HTTPException(status_code=404, detail="User not found")
 
-    token = create_token({
+    trust_request_device(request, user_id)
+
+    token, refresh_token = issue_session_tokens({
         "sub": user_id,
         "username": user_row["username"],
         "role": user_row["role"],
         "mfa": True,
         "email_mfa": True,
         "risk_score": float(context.get("risk_score", 0) or 0)
-    })
+    }, request, grants=step_up_grant("strong_mfa", context.get("resource")))
 
-    return {"access_token": token}
\ No newline at end of file
+    return {"access_token": token, "refresh_token": refresh_token}
\ No newline at end of file
@@ -0,0 +1,191 @@
+# backend/mfa/otp_engine.py
+
+"""
+Email OTP challenges without bcrypt.
+
+A challenge stores HMAC-SHA256(server key, challenge id ‖ code) — never the
+code — in an in-memory TTL store (one live challenge per user). Issue and
+verify are a few microseconds of hashing plus a constant-time compare, so
+the verify path can no longer be used to burn CPU.
+
+The email_otp_challenges table is kept as an audit trail (issued, attempt
+count, consumed). It is also the fallback when the challenge was issued by
+another worker or before a restart: the digest stored there is verified
+the same way.
+"""
+
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta
+
+from backend import metrics
+from backend.auth.password_utils import verify_password
+from backend.config import SECRET_KEY
+from backend.database import get_db
+from backend.timing_wheel import TTLStore
+
+
+OTP_TTL_SECONDS = 300
+OTP_MAX_ATTEMPTS = 5
+OTP_DIGITS = 6
+
+DIGEST_SCHEME = "hmac-sha256"
+
+# Separate key from the JWT signing key, derived from it.
+_OTP_KEY = hmac.new(SECRET_KEY.encode(), b"zta-email-otp", hashlib.sha256).digest()
+
+_challenges = TTLStore(tick_seconds=1.0, slots=OTP_TTL_SECONDS + 60)
+
+
+def _digest(challenge_id: str, code: str) -> str:
+    msg = f"{challenge_id}:{code}".encode()
+    return hmac.new(_OTP_KEY, msg, hashlib.sha256).hexdigest()
+
+
+def _stored_hash(challenge_id: str, digest: str) -> str:
+    return f"{DIGEST_SCHEME}${challenge_id}${digest}"
+
+
+def _matches(challenge: dict, code: str) -> bool:
+    if challenge.get("legacy_hash"):
+        # bcrypt row issued before this engine existed; expires within minutes.
+        return verify_password(code, challenge["legacy_hash"])
+    return hmac.compare_digest(_digest(challenge["id"], code), challenge["digest"])
+
+
+# ==========================================
+# 🔹 Issue
+# ==========================================
+def issue_challenge(user_id: int) -> str:
+    """
+    Creates a new challenge for the user (replacing any live one) and
+    returns the plaintext code to send. The code itself is not kept.
+    """
+    code = str(secrets.randbelow(10 ** OTP_DIGITS)).zfill(OTP_DIGITS)
+    challenge_id = secrets.token_hex(8)
+    digest = _digest(challenge_id, code)
+
+    now = datetime.utcnow()
+    db = get_db()
+    try:
+        cur = db.execute(
+            """
+            INSERT INTO email_otp_challenges (
+                user_id, otp_hash, expires_at, created_at, consumed, attempt_count
+            ) VALUES (?, ?, ?, ?, 0, 0)
+            """,
+            (
+                user_id,
+                _stored_hash(challenge_id, digest),
+                (now + timedelta(seconds=OTP_TTL_SECONDS)).isoformat(),
+                now.isoformat()
+            )
+        )
+        db.commit()
+        row_id = cur.lastrowid
+    finally:
+        db.close()
+
+    _challenges.set(int(user_id), {
+        "id": challenge_id,
+        "row_id": row_id,
+        "digest": digest,
+        "attempts": 0
+    }, OTP_TTL_SECONDS)
+    metrics.incr("otp.issued")
+    return code
+
+
+# ==========================================
+# 🔹 Verify
+# ==========================================
+def _load_latest(user_id: int):
+    """Latest live challenge from the audit table, as an in-memory entry."""
+    db = get_db()
+    try:
+        row = db.execute(
+            """
+            SELECT id, otp_hash, expires_at, attempt_count, consumed
+            FROM email_otp_challenges
+            WHERE user_id=?
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (user_id,)
+        ).fetchone()
+    finally:
+        db.close()
+
+    # Only the newest row counts: issuing a code supersedes older ones
+    # without having to mark them consumed.
+    if not row or row["consumed"] or row["expires_at"] <= datetime.utcnow().isoformat():
+        return None, 0
+
+    ttl = (datetime.fromisoformat(row["expires_at"]) - datetime.utcnow()).total_seconds()
+    challenge = {"row_id": row["id"], "attempts": row["attempt_count"]}
+    parts = row["otp_hash"].split("$")
+    if len(parts) == 3 and parts[0] == DIGEST_SCHEME:
+        challenge["id"], challenge["digest"] = parts[1], parts[2]
+    else:
+        challenge["id"], challenge["legacy_hash"] = f"row{row['id']}", row["otp_hash"]
+    return challenge, ttl
+
+
+def _audit(sql: str, row_id):
+    db = get_db()
+    try:
+        db.execute(sql, (row_id,))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _usable(challenge) -> bool:
+    return challenge is not None and challenge["attempts"] < OTP_MAX_ATTEMPTS
+
+
+def verify_challenge(user_id: int, code: str) -> str:
+    """
+    Checks `code` against the user's live challenge.
+    Returns "ok", "invalid", "expired" or "locked".
+    A challenge is consumed on success and after OTP_MAX_ATTEMPTS failures.
+    """
+    user_id = int(user_id)
+    challenge = _challenges.get(user_id)
+    matched = _usable(challenge) and _matches(challenge, code)
+
+    if not matched:
+        # Not issued here, or a newer code was issued by another worker.
+        latest, ttl = _load_latest(user_id)
+        if latest is not None and (challenge is None or latest["row_id"] != challenge["row_id"]):
+            challenge = latest
+            _challenges.set(user_id, challenge, ttl)
+            metrics.incr("otp.db_fallbacks")
+            matched = _usable(challenge) and _matches(challenge, code)
+
+    if challenge is None:
+        return "expired"
+
+    if matched:
+        if _challenges.pop(user_id) is None:
+            # A concurrent verify of the same code consumed it first.
+            return "expired"
+        _audit("UPDATE email_otp_challenges SET consumed=1 WHERE id=?", challenge["row_id"])
+        metrics.incr("otp.verified")
+        return "ok"
+
+    if _usable(challenge):
+        challenge["attempts"] += 1
+        _audit(
+            "UPDATE email_otp_challenges SET attempt_count=attempt_count+1 WHERE id=?",
+            challenge["row_id"]
+        )
+        metrics.incr("otp.failed")
+        if _usable(challenge):
+            return "invalid"
+
+    _challenges.pop(user_id)
+    _audit("UPDATE email_otp_challenges SET consumed=1 WHERE id=?", challenge["row_id"])
+    metrics.incr("otp.locked")
+    return "locked"
@@ -8,10 +8,15 @@ behavior_logs(
   id, user_id, timestamp, hour, day_of_week,
   ip_address, ip_prefix, country, city,
   device_type, os, browser,
-  resource, session_id, vpn_detected
+  resource, session_id, vpn_detected,
+  event_count, last_timestamp
 )
+  monitor_api_activity rows are aggregated: event_count requests between
+  timestamp and last_timestamp (behavior/activity_aggregator.py).
 
 user_baselines(
-  user_id, baseline_data, last_updated, data_points_count
+  user_id, baseline_data, last_updated, data_points_count, source_log_ids
 )
+  baseline_data / source_log_ids are compact binary (behavior/baseline_codec.py);
+  rows written by older builds are JSON text and are still readable.
 """
@@ -10,8 +10,8 @@ def calculate_device_risk(meta, baseline):
         flags.append("rooted_device")
         return 100, flags
 
-    # 🖥 New Device
-    if meta["device_id"] not in baseline["known_devices"]:
+    # 🖥 New Device (no baseline at all → every device is new)
+    if meta.get("device_id") not in baseline.get("known_devices", ()):
         score += 25
 
     # 🛡 Device Posture
@@ -16,10 +16,16 @@ def calculate_identity_risk(meta: dict, baseline: dict, db=None):
     # ==========================================
     # 1️⃣ IMPOSSIBLE TRAVEL (Hard Override)
     # ==========================================
-    geo_distance = meta.get("geo_distance_km", 0)
-    time_diff = meta.get("time_diff_minutes", 999)
-
-    if time_diff < 30 and geo_distance > 1500:
+    # travel_velocity flags it from the implied speed over the last N
+    # locations; metadata without that field keeps the fixed distance rule.
+    if "impossible_travel" in meta:
+        impossible = bool(meta["impossible_travel"])
+    else:
+        geo_distance = meta.get("geo_distance_km", 0)
+        time_diff = meta.get("time_diff_minutes", 999)
+        impossible = time_diff < 30 and geo_distance > 1500
+
+    if impossible:
         flags.append("impossible_travel")
         return {
             "risk": 100,
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Depends
 from backend.security.auth_dependencies import require_role_access
+from backend.security.session_registry import revoke_device_sessions, revoke_user_sessions
+from backend.behavior.device_index import untrust_device
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
 
@@ -7,4 +9,29 @@ router = APIRouter(prefix="/api/admin", tags=["Admin"])
 def admin_dashboard(
     user=Depends(require_role_access("/api/admin"))
 ):
-    return {"message": "Admin Dashboard"}
\ No newline at end of file
+    return {"message": "Admin Dashboard"}
+
+
+# ==========================================
+# 🔹 Session Revocation
+# ==========================================
+@router.post("/sessions/revoke-user/{user_id}")
+def revoke_user(
+    user_id: int,
+    user=Depends(require_role_access("/api/admin"))
+):
+    return {"revoked": revoke_user_sessions(user_id)}
+
+
+@router.post("/sessions/revoke-device/{device_id}")
+def revoke_device(
+    device_id: str,
+    user_id: int | None = None,
+    user=Depends(require_role_access("/api/admin"))
+):
+    # A revoked device is no longer trusted either: its next login is
+    # scored as a new device.
+    return {
+        "revoked": revoke_device_sessions(device_id, user_id=user_id),
+        "untrusted": untrust_device(device_id, user_id=user_id)
+    }
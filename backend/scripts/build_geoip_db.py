@@ -0,0 +1,101 @@
+"""
+Convert a CSV IP-range dump into the offline GeoIP database used by
+backend/behavior/geoip_db.py.
+
+Supported layouts (--format):
+
+  dbip         DB-IP "IP to City Lite":
+               start_ip,end_ip,continent,country,stateprov,city,latitude,longitude
+  ip2location  IP2Location DB5/DB11 (integer ranges):
+               ip_from,ip_to,country_code,country_name,region,city,latitude,longitude[,...]
+  generic      header row with columns start,end,country,city,lat,lon and
+               optional proxy,asn (start/end may be dotted or integer)
+
+IPv6 rows are skipped; the database covers IPv4 only.
+
+Countries are stored as names, spelled as ip-api.com reports them (see
+country_names.py), so offline and online lookups give the same
+location_country values. ISO codes from dbip / ip2location, and from a
+generic dump that has them, are converted.
+
+Usage (from repo root):
+  python -m backend.scripts.build_geoip_db dbip-city-lite.csv backend/geoip.bin --format dbip
+  export ZTA_GEOIP_DB_PATH=backend/geoip.bin
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+from typing import Iterator
+
+from backend.behavior.geoip_db import ip_to_int, write_geoip_db
+from backend.scripts.country_names import COUNTRY_NAMES
+
+
+def _addr(value: str) -> int | None:
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return number if number <= 0xFFFFFFFF else None
+    return ip_to_int(value)
+
+
+def _truthy(value: str | None) -> bool:
+    return (value or "").strip().lower() in ("1", "true", "yes", "y")
+
+
+def _asn(value: str | None) -> int:
+    value = (value or "").strip().upper().removeprefix("AS")
+    return int(value) if value.isdigit() else 0
+
+
+def _country(value: str | None, fallback: str | None = None) -> str | None:
+    value = (value or "").strip()
+    if not value or value in ("-", "ZZ"):
+        return None
+    if len(value) != 2:
+        return value
+    return COUNTRY_NAMES.get(value.upper(), fallback or value)
+
+
+def _rows(path: str, fmt: str) -> Iterator[tuple]:
+    with open(path, newline="", encoding="utf-8") as fh:
+        if fmt == "generic":
+            for row in csv.DictReader(fh):
+                start, end = _addr(row["start"]), _addr(row["end"])
+                if start is None or end is None:
+                    continue
+                yield (start, end, _country(row.get("country")), row.get("city"),
+                       row.get("lat"), row.get("lon"),
+                       _truthy(row.get("proxy")), _asn(row.get("asn")))
+            return
+
+        for row in csv.reader(fh):
+            if len(row) < 8:
+                continue
+            start, end = _addr(row[0]), _addr(row[1])
+            if start is None or end is None:
+                # Header line or IPv6 range.
+                continue
+            if fmt == "dbip":
+                country, city, lat, lon = _country(row[3]), row[5], row[6], row[7]
+            else:
+                # Code first: ip2location's own names differ from ip-api's.
+                country, city, lat, lon = _country(row[2], row[3]), row[5], row[6], row[7]
+            yield (start, end, country, city if city != "-" else None, lat, lon, False, 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_path")
+    parser.add_argument("out_path")
+    parser.add_argument("--format", choices=("dbip", "ip2location", "generic"), default="generic")
+    args = parser.parse_args()
+
+    written = write_geoip_db(_rows(args.csv_path, args.format), args.out_path)
+    print(f"ranges written={written} -> {args.out_path}")
+
+
+if __name__ == "__main__":
+    main()
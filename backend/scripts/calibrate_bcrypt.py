@@ -0,0 +1,28 @@
+"""
+Benchmark bcrypt on this host and print the highest cost that fits the
+per-verify budget (ZTA_BCRYPT_VERIFY_BUDGET_MS, default 250 ms).
+
+Usage (from repo root):
+  python -m backend.scripts.calibrate_bcrypt [--budget-ms 250]
+  export ZTA_BCRYPT_ROUNDS=<printed value>
+"""
+
+from __future__ import annotations
+
+import argparse
+
+from backend.auth.password_utils import calibrate_rounds
+from backend.config import BCRYPT_VERIFY_BUDGET_MS
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=BCRYPT_VERIFY_BUDGET_MS)
+    args = parser.parse_args()
+
+    rounds = calibrate_rounds(args.budget_ms)
+    print(f"ZTA_BCRYPT_ROUNDS={rounds}")
+
+
+if __name__ == "__main__":
+    main()
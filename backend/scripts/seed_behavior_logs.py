@@ -14,12 +14,13 @@ from __future__ import annotations
 import sqlite3
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-import json
 from statistics import mean, stdev
 from typing import Any, Iterable
 
 from backend.database import get_db
 from backend.behavior.userbaseline_builder import build_user_baseline
+from backend.behavior.baseline_codec import decode_baseline
+from backend.behavior.baseline_loader import normalize_baseline
 from backend.risk_engine.risk_engine import RiskEngine
 
 
@@ -456,6 +457,14 @@ def main() -> None:
         db.execute("DELETE FROM user_baselines")
         db.commit()
 
+        # Trusted devices from earlier runs would hide the "new device" signal
+        # the target bands rely on.
+        try:
+            db.execute("DELETE FROM user_devices")
+            db.commit()
+        except sqlite3.OperationalError:
+            db.rollback()
+
         now_utc = datetime.now(timezone.utc)
         live_login_hour = now_utc.hour
         start = now_utc - timedelta(days=30)
@@ -529,15 +538,7 @@ def main() -> None:
                 "SELECT baseline_data FROM user_baselines WHERE user_id=?",
                 (uid,),
             ).fetchone()
-            baseline_raw = json.loads(row["baseline_data"]) if row else {}
-            baseline = {
-                "avg_login_hour": baseline_raw["temporal"]["login_hours"]["mean"],
-                "login_hour_std": baseline_raw["temporal"]["login_hours"]["std"],
-                "known_devices": baseline_raw["device"]["known_devices"],
-                "avg_session_duration": baseline_raw["session"]["avg_duration"],
-                "avg_data_transfer": baseline_raw["data"]["avg_data_transfer"],
-                "avg_download_volume": baseline_raw["data"]["avg_download_volume"],
-            }
+            baseline = normalize_baseline(decode_baseline(row["baseline_data"]) if row else None)
             # Use a likely new device except user 9 (allow profile).
             device_id = "baseline-device-9" if uid == 9 else f"live-device-{uid}"
             # Simulate immediate next login conditions:
@@ -1,13 +1,14 @@
 # backend/security/auth_dependencies.py
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
-from backend.auth.jwt_utils import verify_token, create_token
+from backend.auth.jwt_utils import request_token_payload, create_token
 
 from backend.security.resource_policy import has_access, get_resource_sensitivity
 from backend.security.stepup_engine import StepUpEngine
-from backend.database import get_db
+from backend.auth.user_profile import get_user_profile
+from backend.security.session_registry import apply_session, has_step_up_grant
 from backend.approval.approval_utils import create_approval_request
 
 
@@ -23,14 +24,16 @@ stepup_engine = StepUpEngine()
 PERMITTED_ROLE_SENSITIVITY = 0.3
 
 
-def build_pending_mfa_token(user: dict) -> str:
+def build_pending_mfa_token(user: dict, resource: str = None) -> str:
     return create_token(
         {
             "sub": user.get("sub"),
             "username": user.get("username"),
             "role": user.get("role"),
             "risk_score": float(user.get("risk_score", 0) or 0),
-            "mfa_pending": True
+            "mfa_pending": True,
+            # Completing step-up grants access to this resource class.
+            "resource": resource
         },
         expiry_minutes=60
     )
@@ -40,15 +43,21 @@ def build_pending_mfa_token(user: dict) -> str:
 # 🔹 Get Current Authenticated User
 # ==========================================
 def get_current_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
 
     token = credentials.credentials
-    payload = verify_token(token)
+    # Already verified by monitor_middleware for this request in most cases.
+    payload = request_token_payload(request, token)
 
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
+    # Revoked sessions stop here; live sessions carry their current risk.
+    if apply_session(payload) is None:
+        raise HTTPException(status_code=401, detail="Session revoked or expired")
+
     return payload
 
 
@@ -87,27 +96,19 @@ def require_role_access(resource: str):
         risk_score = user.get("risk_score", 0) or 0
         action = stepup_engine.evaluate(float(risk_score), PERMITTED_ROLE_SENSITIVITY)
 
+        # Step-up already completed for this resource class in this session.
+        if action in ["mfa", "strong_mfa"] and has_step_up_grant(user, resource, action):
+            action = "allow"
+
         if action in ["mfa", "strong_mfa", "manager_approval", "block"]:
             user_id = user.get("sub")
 
             # Look up enrollment state so we can tell frontend whether setup is needed.
-            enrolled_mfa = False
             try:
-                conn = get_db()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT mfa_secret, mfa_enabled, biometric_credential_id FROM users WHERE id=?",
-                    (user_id,)
-                )
-                row = cursor.fetchone()
-                conn.close()
-                if row:
-                    enrolled_mfa = bool(row["mfa_secret"]) and int(row["mfa_enabled"] or 0) == 1
-                    has_biometric = row["biometric_credential_id"] is not None
-                else:
-                    has_biometric = False
+                profile = get_user_profile(user_id) or {}
             except Exception:
-                has_biometric = False
+                profile = {}
+            enrolled_mfa = profile.get("mfa_enrolled", False)
 
             if action == "block":
                 raise HTTPException(status_code=403, detail="High risk request blocked.")
@@ -134,7 +135,7 @@ def require_role_access(resource: str):
                         "user_id": user_id,
                         "risk_score": float(risk_score),
                         "resource": resource,
-                        "pending_mfa_token": build_pending_mfa_token(user)
+                        "pending_mfa_token": build_pending_mfa_token(user, resource)
                     }
                 )
 
@@ -147,7 +148,7 @@ def require_role_access(resource: str):
                         "user_id": user_id,
                         "risk_score": float(risk_score),
                         "resource": resource,
-                        "pending_mfa_token": build_pending_mfa_token(user)
+                        "pending_mfa_token": build_pending_mfa_token(user, resource)
                     }
                 )
 
@@ -159,7 +160,7 @@ def require_role_access(resource: str):
                     "user_id": user_id,
                     "risk_score": float(risk_score),
                     "resource": resource,
-                    "pending_mfa_token": build_pending_mfa_token(user)
+                    "pending_mfa_token": build_pending_mfa_token(user, resource)
                 }
             )
 
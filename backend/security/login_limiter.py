@@ -0,0 +1,283 @@
+# backend/security/login_limiter.py
+
+"""
+Login throttling, consulted before the user lookup and bcrypt.
+
+Two mechanisms, keyed by account (email), source IP and /24 ip_prefix:
+
+- Token buckets (IP, prefix) shape the raw attempt rate. They live in
+  worker memory only, so a flood is turned away with a dict lookup.
+- Sliding-window failure counters (account, IP, prefix). Crossing a scope's
+  limit locks that key out; repeat lockouts within LOCKOUT_DECAY_SECONDS
+  escalate through LOGIN_LOCKOUT_SCHEDULE. A good password resets the
+  account's counters (not the IP's).
+
+Failure windows and lockouts are kept in memory by default. With
+ZTA_LOGIN_LIMITER_BACKEND=sqlite they go through the login_limits table so
+they hold across uvicorn workers; lockouts already seen are still rejected
+from memory without a DB read.
+
+The sliding window is the two-bucket approximation: previous fixed
+window's count weighted by its remaining overlap, plus the current one.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from backend import metrics
+from backend.behavior.metadata_collector import extract_ip_prefix
+from backend.config import LOGIN_LIMITER_BACKEND, LOGIN_LOCKOUT_SCHEDULE
+from backend.database import get_db
+
+
+# scope -> failures allowed per window before lockout
+FAILURE_LIMITS = {
+    "account": {"failures": 5, "window": 900},
+    "ip": {"failures": 20, "window": 900},
+    "prefix": {"failures": 100, "window": 900}
+}
+
+# scope -> attempt bucket (burst capacity, refill per second)
+ATTEMPT_BUCKETS = {
+    "ip": {"capacity": 10, "rate": 1.0},
+    "prefix": {"capacity": 50, "rate": 5.0}
+}
+
+# A lockout older than this no longer escalates the next one.
+LOCKOUT_DECAY_SECONDS = 86400
+
+# Keys tracked per worker; least recently used are dropped.
+LIMITER_MAX_KEYS = 100000
+
+
+class LoginThrottled(Exception):
+    """Raised when a login may not proceed; `retry_after` is in seconds."""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"login throttled ({scope})")
+        self.scope = scope
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def _keys(email, ip) -> dict:
+    keys = {}
+    if email:
+        keys["account"] = "acct:" + str(email).strip().lower()
+    if ip:
+        keys["ip"] = "ip:" + ip
+        prefix = extract_ip_prefix(ip)
+        if prefix:
+            keys["prefix"] = "net:" + prefix
+    return keys
+
+
+def _new_record(now) -> dict:
+    return {
+        "window_start": now, "curr": 0, "prev": 0,
+        "locked_until": 0.0, "lock_level": 0, "last_lock": 0.0
+    }
+
+
+def _roll(rec, now, window) -> float:
+    """Advances the record's fixed windows and returns the sliding count."""
+    elapsed = int((now - rec["window_start"]) // window)
+    if elapsed == 1:
+        rec["prev"], rec["curr"] = rec["curr"], 0
+        rec["window_start"] += window
+    elif elapsed >= 2:
+        rec["prev"] = rec["curr"] = 0
+        rec["window_start"] = now - (now - rec["window_start"]) % window
+    overlap = 1 - (now - rec["window_start"]) / window
+    return rec["prev"] * overlap + rec["curr"]
+
+
+def _lock_out(rec, now, seconds=None) -> float:
+    if now - rec["last_lock"] > LOCKOUT_DECAY_SECONDS:
+        rec["lock_level"] = 0
+    rec["lock_level"] = min(rec["lock_level"] + 1, len(LOGIN_LOCKOUT_SCHEDULE))
+    if seconds is None:
+        seconds = LOGIN_LOCKOUT_SCHEDULE[rec["lock_level"] - 1]
+    rec["locked_until"] = max(rec["locked_until"], now + seconds)
+    rec["last_lock"] = now
+    rec["prev"] = rec["curr"] = 0
+    return rec["locked_until"]
+
+
+# ==========================================
+# 🔹 Stores
+# ==========================================
+class MemoryLimiterStore:
+
+    def __init__(self, max_keys=LIMITER_MAX_KEYS):
+        self.max_keys = max_keys
+        self._records = OrderedDict()
+
+    def update(self, key, now, fn):
+        """Applies `fn(record)` to the key's record and stores it."""
+        rec = self._records.get(key) or _new_record(now)
+        result = fn(rec)
+        self._remember(key, rec)
+        return result
+
+    def _remember(self, key, rec):
+        self._records[key] = rec
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_keys:
+            self._records.popitem(last=False)
+
+    def delete(self, key):
+        self._records.pop(key, None)
+
+    def locked_until(self, key) -> float:
+        rec = self._records.get(key)
+        return rec["locked_until"] if rec else 0.0
+
+
+class SQLiteLimiterStore(MemoryLimiterStore):
+    """
+    Write-through to login_limits. Memory acts as a cache of lockouts so
+    known-locked keys are rejected without a query; windows are always
+    read from the DB so every worker counts the same failures.
+    """
+
+    COLUMNS = ("window_start", "curr", "prev", "locked_until", "lock_level", "last_lock")
+
+    def update(self, key, now, fn):
+        db = get_db()
+        try:
+            # Take the write lock up front so read-modify-write is atomic
+            # across workers.
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT * FROM login_limits WHERE limit_key=?", (key,)
+            ).fetchone()
+            rec = {c: row[c] for c in self.COLUMNS} if row else _new_record(now)
+            result = fn(rec)
+            db.execute(
+                """
+                INSERT OR REPLACE INTO login_limits (limit_key, window_start, curr, prev,
+                                                     locked_until, lock_level, last_lock)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, *(rec[c] for c in self.COLUMNS))
+            )
+            db.commit()
+        finally:
+            db.close()
+        self._remember(key, rec)
+        return result
+
+    def delete(self, key):
+        super().delete(key)
+        db = get_db()
+        try:
+            db.execute("DELETE FROM login_limits WHERE limit_key=?", (key,))
+            db.commit()
+        finally:
+            db.close()
+
+    def locked_until(self, key) -> float:
+        cached = super().locked_until(key)
+        if cached > time.time():
+            return cached
+        db = get_db()
+        try:
+            row = db.execute(
+                "SELECT locked_until FROM login_limits WHERE limit_key=?", (key,)
+            ).fetchone()
+        finally:
+            db.close()
+        return row["locked_until"] if row else 0.0
+
+
+# ==========================================
+# 🔹 Limiter
+# ==========================================
+class LoginLimiter:
+
+    def __init__(self, store=None):
+        self.store = store or MemoryLimiterStore()
+        self._buckets = OrderedDict()     # key -> [tokens, last_refill]
+        self._lock = threading.Lock()
+
+    def _take_token(self, key, capacity, rate, now) -> float:
+        """Returns 0 if a token was taken, else seconds until one is available."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(capacity), now]
+            while len(self._buckets) > LIMITER_MAX_KEYS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+    def check(self, email, ip):
+        """
+        Call before looking the user up. Raises LoginThrottled if any scope
+        is locked out or the source is over its attempt rate.
+        """
+        now = time.time()
+        keys = _keys(email, ip)
+        with self._lock:
+            # Attempt rate first: pure memory, so floods never reach the store.
+            for scope, bucket in ATTEMPT_BUCKETS.items():
+                if scope not in keys:
+                    continue
+                wait = self._take_token(keys[scope], bucket["capacity"], bucket["rate"], now)
+                if wait:
+                    metrics.incr(f"login_limiter.rate_limited.{scope}")
+                    raise LoginThrottled(scope, wait)
+
+            for scope, key in keys.items():
+                until = self.store.locked_until(key)
+                if until > now:
+                    metrics.incr(f"login_limiter.locked.{scope}")
+                    raise LoginThrottled(scope, until - now)
+
+    def record_failure(self, email, ip):
+        """Counts a failed login; locks out any scope that crossed its limit."""
+        now = time.time()
+        with self._lock:
+            for scope, key in _keys(email, ip).items():
+                limit = FAILURE_LIMITS[scope]
+
+                def _count(rec):
+                    failures = _roll(rec, now, limit["window"]) + 1
+                    rec["curr"] += 1
+                    if failures >= limit["failures"]:
+                        _lock_out(rec, now)
+                        metrics.incr(f"login_limiter.lockouts.{scope}")
+
+                self.store.update(key, now, _count)
+
+    def record_success(self, email):
+        """A good password clears the account's failures and lockout history."""
+        key = _keys(email, None).get("account")
+        if key:
+            with self._lock:
+                self.store.delete(key)
+
+    def block(self, scope, value, seconds=None):
+        """
+        Locks out an IP ("ip") or network ("prefix", value is the IP or CIDR)
+        for `seconds`, or the next escalation step. Used by detectors.
+        """
+        if scope == "prefix" and "/" not in value:
+            value = extract_ip_prefix(value)
+        key = {"ip": "ip:", "prefix": "net:", "account": "acct:"}[scope] + value.strip().lower()
+        now = time.time()
+        with self._lock:
+            until = self.store.update(key, now, lambda rec: _lock_out(rec, now, seconds))
+        metrics.incr(f"login_limiter.blocks.{scope}")
+        return until
+
+
+login_limiter = LoginLimiter(
+    SQLiteLimiterStore() if LOGIN_LIMITER_BACKEND == "sqlite" else MemoryLimiterStore()
+)
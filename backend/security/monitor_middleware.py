@@ -1,239 +1,405 @@
 # backend/security/monitor_middleware.py
 
+import asyncio
+
 from fastapi.responses import JSONResponse
-from fastapi import Request, HTTPException
+from fastapi import Request
 
 from backend.auth.jwt_utils import verify_token, create_token
 from backend.risk_engine.risk_engine import RiskEngine
 
-from backend.behavior.baseline_loader import load_user_baseline
-from backend.behavior.metadata_collector import collect_login_metadata  # now async
-from backend.behavior.behaviorhistory_logger import log_behavior_event   # FIX: renamed
-
-from backend.security.resource_policy import has_access
+from backend.behavior.baseline_loader import load_user_baseline, normalize_baseline
+from backend.behavior.cohort_baseline import with_cohort_fallback
+from backend.behavior.metadata_collector import (
+    collect_login_metadata,  # now async
+    extract_ip_prefix,
+    generate_device_id
+)
+from backend.behavior.activity_aggregator import record_activity
+
+from backend.security.resource_policy import has_access, get_resource_sensitivity
+from backend.security.monitor_sampler import monitor_sampler, sensitivity_class
+from backend.security.monitor_queue import deferred_monitor
+from backend.config import MONITOR_DEFERRED, MONITOR_SYNC_SENSITIVITY
+from backend.security.token_replay import client_fingerprint
+from backend.security.session_registry import (
+    apply_session,
+    has_step_up_grant,
+    update_session_risk
+)
 from backend.approval.approval_utils import create_approval_request
-from backend.database import get_db
+from backend.auth.user_profile import get_user_profile
 
 risk_engine = RiskEngine()
 
 
-def build_pending_mfa_token(user_id, username, role, risk_score: float) -> str:
+def build_pending_mfa_token(user_id, username, role, risk_score: float, resource: str = None) -> str:
     return create_token(
         {
             "sub": user_id,
             "username": username,
             "role": role,
             "risk_score": float(risk_score),
-            "mfa_pending": True
+            "mfa_pending": True,
+            "resource": resource
         },
         expiry_minutes=60
     )
 
 
-async def monitor_middleware(request: Request, call_next):
+async def _reevaluate(request: Request, payload: dict, aggregate: dict, offload: bool = False):
+    """
+    Full monitoring pipeline for one request. Returns the new risk score,
+    or None when the user has no baseline to score against. With
+    `offload`, the DB-bound steps run in a worker thread.
+    """
+    user_id = payload.get("sub")
+
+    # =====================================
+    # 4️⃣ COLLECT RUNTIME METADATA
+    # FIX: collect_login_metadata is now async (uses httpx + cache).
+    # Must be awaited. The geo result is cached per IP so the
+    # external HTTP call only fires once per IP per 5 minutes,
+    # eliminating the per-request blocking latency that was the
+    # most severe performance issue in monitored sessions.
+    # =====================================
+
+    metadata = await collect_login_metadata(
+        request=request,
+        user_id=user_id,
+        username=payload.get("username")
+    )
+
+    metadata["action"] = "monitor_api_activity"
+    # Aggregated per session, so repeats merge into the session's open row.
+    if payload.get("sid"):
+        metadata["session_id"] = payload["sid"]
+    # Requests only counted since the previous re-evaluation, per resource.
+    metadata["sampled_resources"] = aggregate["resources"]
+
+    if offload:
+        return await asyncio.to_thread(_log_and_score, payload, metadata)
+    return _log_and_score(payload, metadata)
+
+
+def _log_and_score(payload: dict, metadata: dict):
+    user_id = payload.get("sub")
+    role = payload.get("role")
+
+    # =====================================
+    # 5️⃣ LOG SESSION ACTIVITY
+    # Repeats merge into one aggregated row; anomalies get their own.
+    # =====================================
+
+    record_activity(metadata)
+
+    # =====================================
+    # 6️⃣ LOAD USER BASELINE
+    # =====================================
+
+    baseline_raw = with_cohort_fallback(
+        load_user_baseline(user_id),
+        role,
+        metadata["ip_prefix"]
+    )
+
+    if not baseline_raw:
+        return None
+
+    baseline = normalize_baseline(baseline_raw, user_id=user_id)
+
+    # =====================================
+    # 7️⃣ CONTINUOUS RISK RE-EVALUATION
+    # =====================================
+
+    risk_result = risk_engine.evaluate(metadata, baseline)
+    risk_score = risk_result["score"]
+
+    # Later requests in this session see the new risk at once.
+    if payload.get("sid"):
+        update_session_risk(payload["sid"], risk_score)
+
+    return risk_score
+
+
+def _defer(request: Request, payload: dict, aggregate: dict, sensitivity: float) -> bool:
+    """
+    Queues the re-evaluation instead of running it inline. Its outcome is
+    written to the session's risk and enforced on the next request, so this
+    needs a session; high-sensitivity resources are always scored inline.
     """
-    Adaptive Zero Trust Monitoring Middleware
+    if not MONITOR_DEFERRED or not payload.get("sid") or sensitivity >= MONITOR_SYNC_SENSITIVITY:
+        return False
+
+    payload = dict(payload)
+
+    async def job():
+        risk_score = await _reevaluate(request, payload, aggregate, offload=True)
+        # Everything else is enforced from the session's risk on the next
+        # request; the approval request has to be filed now.
+        if risk_score is not None and 86 <= risk_score <= 95:
+            await asyncio.to_thread(
+                create_approval_request,
+                user_id=payload.get("sub"),
+                resource=request.url.path,
+                risk_score=risk_score
+            )
+
+    return deferred_monitor.submit(job)
+
+
+def _escalation_response(payload: dict, path: str, risk_score: float, fresh: bool = True):
+    """
+    Escalation for the session's current risk, or None to let the request
+    through. `fresh` is False when enforcing a risk computed by an earlier
+    re-evaluation; approval requests are then not filed again.
+    """
+    user_id = payload.get("sub")
+    username = payload.get("username")
+    role = payload.get("role")
+
+    # =====================================
+    # 8️⃣ ADAPTIVE ESCALATION LOGIC
+    # =====================================
+
+    # Level 1 escalation: MFA (unless already granted for this section)
+    if 56 <= risk_score <= 70 and not has_step_up_grant(payload, path, "mfa"):
+        # If user hasn't enrolled MFA yet, return
+        # mfa_setup_required so frontend shows OTP page with a
+        # "Setup MFA" CTA.
+        try:
+            enrolled_mfa = get_user_profile(user_id)["mfa_enrolled"]
+        except Exception:
+            enrolled_mfa = False
+
+        status = "mfa_required" if enrolled_mfa else "mfa_setup_required"
+        return JSONResponse(
+            status_code=401,
+            content={"detail": {
+                "status": status,
+                "methods": ["totp"],
+                "user_id": user_id,
+                "risk_score": risk_score,
+                "pending_mfa_token": build_pending_mfa_token(
+                    user_id=user_id,
+                    username=username,
+                    role=role,
+                    risk_score=risk_score,
+                    resource=path
+                )
+            }}
+        )
+
+    # Level 2 escalation: Strong MFA (aligned with StepUpEngine: < 86)
+    if 71 <= risk_score < 86 and not has_step_up_grant(payload, path, "strong_mfa"):
+        return JSONResponse(
+            status_code=401,
+            content={"detail": {
+                "status": "strong_mfa_required",
+                "methods": ["biometric", "email_otp"],
+                "message": "Strong MFA required. Risk score is high.",
+                "user_id": user_id,
+                "risk_score": risk_score,
+                "pending_mfa_token": build_pending_mfa_token(
+                    user_id=user_id,
+                    username=username,
+                    role=role,
+                    risk_score=risk_score,
+                    resource=path
+                )
+            }}
+        )
+
+    # Level 3 escalation: Manager Approval
+    if 86 <= risk_score <= 95:
+        if fresh:
+            create_approval_request(
+                user_id=user_id,
+                resource=path,
+                risk_score=risk_score
+            )
+
+        return JSONResponse(
+            status_code=403,
+            content={"detail": {
+                "status": "manager_approval_required",
+                "user_id": user_id,
+                "risk_score": risk_score
+            }}
+        )
+
+    if risk_score > 95:
+        return JSONResponse(
+            status_code=403,
+            content={"detail": {
+                "status": "blocked",
+                "user_id": user_id,
+                "risk_score": risk_score,
+                "message": "Risk score too high; request blocked."
+            }}
+        )
+
+    return None
+
+
+def _deny(status_code: int, detail):
+    return JSONResponse(status_code=status_code, content={"detail": detail})
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+class MonitorMiddleware:
+    """
+    Adaptive Zero Trust Monitoring Middleware (pure ASGI)
 
     Performs:
     1. Session behavioral logging
     2. Continuous risk re-evaluation
     3. Adaptive escalation (MFA / Strong MFA / Approval)
     4. RBAC enforcement even in monitor mode
+
+    Checks run on the raw scope before the app is called; a denial is sent
+    directly, otherwise the app's response passes through untouched (no
+    buffering, streaming responses keep streaming).
     """
 
-    auth_header = request.headers.get("Authorization")
-    path = request.url.path
+    def __init__(self, app):
+        self.app = app
 
-    if auth_header:
-        hs = auth_header.strip()
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        denial = await self._check(scope)
+        if denial is not None:
+            await denial(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+    async def _check(self, scope):
+        """Returns a response to send instead of calling the app, or None."""
+        auth_header = _header(scope, b"authorization").strip()
+        if not auth_header:
+            return None
+
+        path = scope["path"]
         token = None
-        if hs.lower().startswith("bearer "):
-            token = hs[7:].strip() or None
+        if auth_header.lower().startswith("bearer "):
+            token = auth_header[7:].strip() or None
+
+        payload = None
         if token:
-            payload = verify_token(token)
-        else:
-            payload = None
+            ip = scope["client"][0] if scope.get("client") else ""
+            payload = verify_token(
+                token,
+                fingerprint=client_fingerprint(ip, _header(scope, b"user-agent"))
+            )
 
-    if auth_header and token:
+        # Decode once: dependencies and MFA routers reuse this payload
+        # (request.state is backed by scope["state"]).
+        state = scope.setdefault("state", {})
+        state["token"] = token
+        state["token_payload"] = payload
+
+        if not payload:
+            return None
+
+        # Token presented from a client other than the one it was bound to:
+        # token_replay is a critical override, so refuse outright.
+        if payload.get("token_replay"):
+            return _deny(401, {
+                "status": "token_replay",
+                "user_id": payload.get("sub"),
+                "risk_score": 100,
+                "flags": ["token_replay"],
+                "message": "Session token used from an unrecognised client. Please sign in again."
+            })
+
+        # Server-side session: refuse if revoked, else use its live risk/mode.
+        if apply_session(payload) is None:
+            return _deny(401, {
+                "status": "session_revoked",
+                "message": "Session is no longer valid. Please sign in again."
+            })
 
         # Poll endpoint must bypass RBAC (non-manager roles cannot access /api/approvals/*).
-        if payload and path.startswith("/api/approvals/status"):
-            return await call_next(request)
+        if path.startswith("/api/approvals/status"):
+            return None
 
         # Pre-approval JWT: only status polling is allowed — not dashboard, MFA, or data APIs.
-        if payload and payload.get("approval_pending"):
-            return JSONResponse(
-                status_code=403,
-                content={
-                    "detail": {
-                        "status": "manager_approval_required",
-                        "message": "Awaiting manager approval. You cannot use the app until approved.",
-                    }
-                },
-            )
+        if payload.get("approval_pending"):
+            return _deny(403, {
+                "status": "manager_approval_required",
+                "message": "Awaiting manager approval. You cannot use the app until approved.",
+            })
 
         # MFA routes are not listed in ROLE_ACCESS. Any valid JWT (pending MFA
         # step-up or normal session) may call /mfa/*; binding is enforced in
         # mfa_router (sub must match user_id).
-        if payload and path.startswith("/mfa/"):
-            return await call_next(request)
-
-        if payload:
-            user_id = payload.get("sub")
-            username = payload.get("username")
-            role = payload.get("role")
-
-            # =========================================
-            # 1️⃣ RBAC ENFORCEMENT (Always apply)
-            # =========================================
-
-            if not has_access(role, path):
-                raise HTTPException(
-                    status_code=403,
-                    detail="Access denied for your role."
-                )
-
-            # =========================================
-            # 2️⃣ MONITOR MODE CHECK
-            # =========================================
-
-            if payload.get("monitor"):
-
-                # =====================================
-                # 3️⃣ COLLECT RUNTIME METADATA
-                # FIX: collect_login_metadata is now async (uses httpx + cache).
-                # Must be awaited. The geo result is cached per IP so the
-                # external HTTP call only fires once per IP per 5 minutes,
-                # eliminating the per-request blocking latency that was the
-                # most severe performance issue in monitored sessions.
-                # =====================================
-
-                metadata = await collect_login_metadata(
-                    request=request,
-                    user_id=user_id,
-                    username=username
-                )
-
-                metadata["action"] = "monitor_api_activity"
-
-                # =====================================
-                # 4️⃣ LOG SESSION ACTIVITY
-                # FIX: use renamed log_behavior_event
-                # =====================================
-
-                log_behavior_event(metadata)
-
-                # =====================================
-                # 5️⃣ LOAD USER BASELINE
-                # =====================================
-
-                baseline_raw = load_user_baseline(user_id)
-
-                if baseline_raw:
-
-                    baseline = {
-                        "avg_login_hour": baseline_raw["temporal"]["login_hours"]["mean"],
-                        "login_hour_std": baseline_raw["temporal"]["login_hours"]["std"],
-                        "known_devices": baseline_raw["device"]["known_devices"],
-                        "avg_session_duration": baseline_raw["session"]["avg_duration"],
-                        "avg_data_transfer": baseline_raw["data"]["avg_data_transfer"],
-                        "avg_download_volume": baseline_raw["data"]["avg_download_volume"]
-                    }
-
-                    # =====================================
-                    # 6️⃣ CONTINUOUS RISK RE-EVALUATION
-                    # =====================================
-
-                    risk_result = risk_engine.evaluate(metadata, baseline)
-                    risk_score = risk_result["score"]
-
-                    # =====================================
-                    # 7️⃣ ADAPTIVE ESCALATION LOGIC
-                    # =====================================
-
-                    # Level 1 escalation: MFA
-                    if 56 <= risk_score <= 70:
-                        # If user hasn't enrolled MFA yet, return
-                        # mfa_setup_required so frontend shows OTP page with a
-                        # "Setup MFA" CTA.
-                        enrolled_mfa = False
-                        try:
-                            conn = get_db()
-                            cursor = conn.cursor()
-                            cursor.execute(
-                                "SELECT mfa_secret, mfa_enabled FROM users WHERE id=?",
-                                (user_id,)
-                            )
-                            row = cursor.fetchone()
-                            conn.close()
-                            enrolled_mfa = bool(row["mfa_secret"]) and int(row["mfa_enabled"] or 0) == 1
-                        except Exception:
-                            enrolled_mfa = False
-
-                        status = "mfa_required" if enrolled_mfa else "mfa_setup_required"
-                        return JSONResponse(
-                            status_code=401,
-                            content={"detail": {
-                                "status": status,
-                                "methods": ["totp"],
-                                "user_id": user_id,
-                                "risk_score": risk_score,
-                                "pending_mfa_token": build_pending_mfa_token(
-                                    user_id=user_id,
-                                    username=username,
-                                    role=role,
-                                    risk_score=risk_score
-                                )
-                            }}
-                        )
-
-                    # Level 2 escalation: Strong MFA (aligned with StepUpEngine: < 86)
-                    if 71 <= risk_score < 86:
-                        return JSONResponse(
-                            status_code=401,
-                            content={"detail": {
-                                "status": "strong_mfa_required",
-                                "methods": ["biometric", "email_otp"],
-                                "message": "Strong MFA required. Risk score is high.",
-                                "user_id": user_id,
-                                "risk_score": risk_score,
-                                "pending_mfa_token": build_pending_mfa_token(
-                                    user_id=user_id,
-                                    username=username,
-                                    role=role,
-                                    risk_score=risk_score
-                                )
-                            }}
-                        )
-
-                    # Level 3 escalation: Manager Approval
-                    if 86 <= risk_score <= 95:
-                        create_approval_request(
-                            user_id=user_id,
-                            resource=request.url.path,
-                            risk_score=risk_score
-                        )
-
-                        return JSONResponse(
-                            status_code=403,
-                            content={"detail": {
-                                "status": "manager_approval_required",
-                                "user_id": user_id,
-                                "risk_score": risk_score
-                            }}
-                        )
-
-                    if risk_score > 95:
-                        return JSONResponse(
-                            status_code=403,
-                            content={"detail": {
-                                "status": "blocked",
-                                "user_id": user_id,
-                                "risk_score": risk_score,
-                                "message": "Risk score too high; request blocked."
-                            }}
-                        )
-
-    response = await call_next(request)
-
-    return response
\ No newline at end of file
+        if path.startswith("/mfa/"):
+            return None
+
+        # Metrics are not in ROLE_ACCESS either; the route's require_manager
+        # dependency restricts it to managers and admins.
+        if path == "/api/metrics":
+            return None
+
+        # Refresh authenticates with the refresh token in the body; clients
+        # refreshing early may still send their (valid) access token.
+        if path == "/api/token/refresh":
+            return None
+
+        user_id = payload.get("sub")
+        role = payload.get("role")
+
+        # =========================================
+        # 1️⃣ RBAC ENFORCEMENT (Always apply)
+        # =========================================
+
+        if not has_access(role, path):
+            return _deny(403, "Access denied for your role.")
+
+        # =========================================
+        # 2️⃣ MONITOR MODE CHECK
+        # =========================================
+
+        if not payload.get("monitor"):
+            return None
+
+        # =====================================
+        # 3️⃣ SAMPLE: FULL RE-EVALUATION OR COUNT ONLY
+        # =====================================
+
+        ip = scope["client"][0] if scope.get("client") else ""
+        sensitivity = get_resource_sensitivity(path, role)
+        sample = monitor_sampler.observe(
+            payload.get("sid") or payload.get("jti") or user_id,
+            extract_ip_prefix(ip),
+            generate_device_id(_header(scope, b"user-agent"), ip),
+            sensitivity_class(sensitivity),
+            path
+        )
+
+        risk_score = None
+        if sample is not None:
+            # Only re-evaluation needs the full request view.
+            request = Request(scope)
+            if not _defer(request, payload, sample[1], sensitivity):
+                risk_score = await _reevaluate(request, payload, sample[1])
+        # Only an inline re-evaluation may file an approval request; a
+        # deferred one files its own from the new score.
+        fresh = risk_score is not None
+        if risk_score is None:
+            # Between re-evaluations (deferred, or without a baseline) the
+            # session's live risk is still enforced.
+            risk_score = payload.get("risk_score")
+
+        if risk_score is None:
+            return None
+        return _escalation_response(payload, path, float(risk_score), fresh=fresh)
@@ -0,0 +1,72 @@
+# backend/security/monitor_queue.py
+
+"""
+Background queue for deferred monitoring work.
+
+Monitored requests hand their re-evaluation (metadata, behavior log,
+baseline, RiskEngine) to this queue and proceed at once. A few worker
+tasks drain it; the outcome is written to the session and enforced on the
+session's next request.
+
+The queue is bounded. submit() returns False when it is full or not
+running (e.g. outside the app lifespan), and the caller falls back to
+doing the work inline, so load shedding never skips a re-evaluation.
+"""
+
+import asyncio
+import logging
+
+from backend import metrics
+
+
+MONITOR_QUEUE_SIZE = 1000
+MONITOR_QUEUE_WORKERS = 2
+
+logger = logging.getLogger("monitor_queue")
+
+
+class DeferredMonitor:
+
+    def __init__(self, size=MONITOR_QUEUE_SIZE, workers=MONITOR_QUEUE_WORKERS):
+        self.size = size
+        self.workers = workers
+        self._queue = None
+        self._tasks = []
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, job) -> bool:
+        """Queues `job`, a zero-argument coroutine function."""
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.incr("monitor.queue_full")
+            return False
+        metrics.set_gauge("monitor.queue_depth", self._queue.qsize())
+        return True
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                with metrics.timed("monitor.deferred"):
+                    await job()
+            except Exception:
+                logger.exception("deferred monitoring job failed")
+                metrics.incr("monitor.deferred_errors")
+            finally:
+                self._queue.task_done()
+
+
+deferred_monitor = DeferredMonitor()
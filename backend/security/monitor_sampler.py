@@ -0,0 +1,122 @@
+# backend/security/monitor_sampler.py
+
+"""
+Sampling policy for continuous monitoring.
+
+A monitored session does not need the full pipeline (geo, metadata,
+behavior log, baseline, RiskEngine) on every request. A full
+re-evaluation runs when:
+
+- it is the session's first monitored request,
+- MONITOR_REEVAL_INTERVAL_SECONDS have passed since the last one,
+- MONITOR_REEVAL_EVERY_N requests were counted since the last one, or
+- a cheap delta check sees the /24 prefix, the device id or the path's
+  sensitivity class change.
+
+Requests in between are only counted into the session's aggregate
+(request count and per-resource counts), which is handed to the next full
+re-evaluation. Enforcement still applies between re-evaluations: the
+middleware checks the session's live risk on every request.
+"""
+
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from backend import metrics
+from backend.config import MONITOR_REEVAL_EVERY_N, MONITOR_REEVAL_INTERVAL_SECONDS
+
+
+# Monitored sessions tracked per worker; least recently seen are dropped
+# (a dropped session simply gets a full re-evaluation next time).
+MONITOR_MAX_SESSIONS = 20000
+
+
+def sensitivity_class(sensitivity: float) -> str:
+    if sensitivity >= 0.7:
+        return "high"
+    if sensitivity >= 0.4:
+        return "medium"
+    return "low"
+
+
+class _SessionSample:
+
+    __slots__ = ("last_eval", "ip_prefix", "device_id", "sensitivity", "count", "resources")
+
+    def __init__(self):
+        self.last_eval = 0.0
+        self.ip_prefix = None
+        self.device_id = None
+        self.sensitivity = None
+        self.count = 0
+        self.resources = Counter()
+
+
+class MonitorSampler:
+
+    def __init__(self, interval=MONITOR_REEVAL_INTERVAL_SECONDS, every_n=MONITOR_REEVAL_EVERY_N):
+        self.interval = interval
+        self.every_n = every_n
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, key, ip_prefix, device_id, sensitivity, resource):
+        """
+        Records one monitored request. Returns None when it only needs
+        counting, else (reason, aggregate) where aggregate summarises the
+        requests skipped since the previous full re-evaluation.
+        """
+        now = time.monotonic()
+        with self._lock:
+            sample = self._sessions.get(key)
+            if sample is None:
+                sample = self._sessions[key] = _SessionSample()
+                while len(self._sessions) > MONITOR_MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+                reason = "first"
+            else:
+                self._sessions.move_to_end(key)
+                reason = self._reason(sample, now, ip_prefix, device_id, sensitivity)
+
+            if reason is None:
+                sample.count += 1
+                sample.resources[resource] += 1
+                metrics.incr("monitor.sampled_out")
+                return None
+
+            aggregate = {"requests": sample.count, "resources": dict(sample.resources)}
+            sample.last_eval = now
+            sample.ip_prefix = ip_prefix
+            sample.device_id = device_id
+            sample.sensitivity = sensitivity
+            sample.count = 0
+            sample.resources = Counter()
+
+        metrics.incr(f"monitor.reevaluated.{reason}")
+        return reason, aggregate
+
+    def _reason(self, sample, now, ip_prefix, device_id, sensitivity):
+        if ip_prefix != sample.ip_prefix:
+            return "ip_prefix"
+        if device_id != sample.device_id:
+            return "device"
+        if sensitivity != sample.sensitivity:
+            return "sensitivity"
+        if now - sample.last_eval >= self.interval:
+            return "interval"
+        if sample.count + 1 >= self.every_n:
+            return "count"
+        return None
+
+    def forget(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+monitor_sampler = MonitorSampler()
+
+metrics.register_collector("monitor_sampler", lambda: {"sessions": len(monitor_sampler)})
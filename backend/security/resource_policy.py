@@ -1,3 +1,7 @@
+from functools import lru_cache
+
+from backend import metrics
+
 RESOURCE_SENSITIVITY = {
     "/api/login": 0.2,
     "/api/dashboard": 0.5,
@@ -21,10 +25,12 @@ ROLE_MULTIPLIER = {
     "employee": 0.9
 }
 
+# Sensitivity of paths under no RESOURCE_SENSITIVITY prefix.
+DEFAULT_SENSITIVITY = 0.2
+
 def get_resource_sensitivity(resource, role):
-    base = RESOURCE_SENSITIVITY.get(resource, 0.2)
-    multiplier = ROLE_MULTIPLIER.get(role, 1.0)
-    return min(base * multiplier, 1.0)
+    """Longest-prefix sensitivity of `resource`, scaled for the role."""
+    return resolve_access(role, resource)[1]
 
 # backend/security/resource_policy.py
 
@@ -58,11 +64,82 @@ ROLE_ACCESS = {
 }
 
 def has_access(role: str, resource: str):
+    return resolve_access(role, resource)[0]
+
+def resource_class(path: str) -> str:
+    """Top-level API section of a path: /api/lab/results/7 -> /api/lab."""
+    return "/".join(path.split("/", 3)[:3])
+
+
+# ==========================================
+# 🔹 Compiled Policy
+# ==========================================
+# ROLE_ACCESS and RESOURCE_SENSITIVITY are compiled into one path-segment
+# trie, so a decision is a single walk over the request path's segments;
+# decisions are then memoized per (role, path).
+POLICY_CACHE_SIZE = 4096
+
+
+class _PolicyNode:
+
+    __slots__ = ("children", "roles", "sensitivity")
+
+    def __init__(self):
+        self.children = {}
+        self.roles = set()          # roles allowed at and below this node
+        self.sensitivity = None     # set where RESOURCE_SENSITIVITY has a prefix
+
+
+def _segments(path: str) -> list:
+    return [seg for seg in path.split("/") if seg]
+
+
+def _node(root: _PolicyNode, path: str) -> _PolicyNode:
+    node = root
+    for seg in _segments(path):
+        node = node.children.setdefault(seg, _PolicyNode())
+    return node
+
+
+def compile_policy(role_access: dict = None, sensitivity: dict = None) -> _PolicyNode:
+    root = _PolicyNode()
+    for role, prefixes in (role_access if role_access is not None else ROLE_ACCESS).items():
+        for prefix in prefixes:
+            _node(root, prefix).roles.add(role)
+    for prefix, value in (sensitivity if sensitivity is not None else RESOURCE_SENSITIVITY).items():
+        _node(root, prefix).sensitivity = value
+    return root
+
+
+_policy = compile_policy()
+
+
+@lru_cache(maxsize=POLICY_CACHE_SIZE)
+def resolve_access(role: str, path: str) -> tuple:
+    """Returns (allowed, sensitivity scaled for the role) in one trie walk."""
+    node = _policy
+    allowed = role in node.roles
+    base = DEFAULT_SENSITIVITY
+    for seg in _segments(path):
+        node = node.children.get(seg)
+        if node is None:
+            break
+        allowed = allowed or role in node.roles
+        if node.sensitivity is not None:
+            base = node.sensitivity
+    return allowed, min(base * ROLE_MULTIPLIER.get(role, 1.0), 1.0)
+
+
+def reload_policy():
+    """Recompiles after ROLE_ACCESS / RESOURCE_SENSITIVITY are changed at runtime."""
+    global _policy
+    _policy = compile_policy()
+    resolve_access.cache_clear()
+
 
-    allowed = ROLE_ACCESS.get(role, [])
+def policy_cache_stats() -> dict:
+    info = resolve_access.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
 
-    for path in allowed:
-        if resource.startswith(path):
-            return True
 
-    return False
\ No newline at end of file
+metrics.register_collector("policy_cache", policy_cache_stats)
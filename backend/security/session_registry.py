@@ -0,0 +1,291 @@
+# backend/security/session_registry.py
+
+"""
+Server-side session registry.
+
+Access tokens carry a `sid` claim. The session it names holds the state
+that must be able to change before the token expires: current risk score,
+mode (normal / monitor), step-up grants and a revoked flag. Lookups are a
+dict hit; every change is written through to the `sessions` table.
+
+Other workers see a change within SESSION_REVALIDATE_SECONDS: a cached
+session older than that is re-read from SQLite on its next use. Bulk
+revocation (all of a user's sessions, or every session on a device) is a
+single UPDATE plus flipping whatever is cached here.
+"""
+
+import json
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from backend import metrics
+from backend.auth.jwt_utils import create_token
+from backend.behavior.metadata_collector import generate_device_id
+from backend.config import ACCESS_TOKEN_EXPIRE_MINUTES, STEPUP_GRANT_TTL_SECONDS
+from backend.database import get_db
+from backend.security.resource_policy import resource_class
+from backend.security.token_replay import request_fingerprint
+
+
+SESSION_REVALIDATE_SECONDS = 5
+# How often cached sessions are swept for expiry.
+SESSION_SWEEP_SECONDS = 60
+
+# Step-up assurance levels; a grant satisfies its own level and those below.
+ASSURANCE_LEVELS = {"mfa": 1, "strong_mfa": 2}
+# Grant key for step-up done at login, before any resource was requested.
+ANY_RESOURCE = "*"
+
+# session id -> state dict (plus "_loaded_at", the monotonic cache time)
+_sessions = {}
+_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _row_to_state(row) -> dict:
+    return {
+        "sid": row["sid"],
+        "user_id": row["user_id"],
+        "device_id": row["device_id"],
+        "risk_score": row["risk_score"],
+        "mode": row["mode"],
+        "grants": json.loads(row["grants"] or "{}"),
+        "revoked": bool(row["revoked"]),
+        "expires_at": row["expires_at"]
+    }
+
+
+def _cache(state: dict) -> dict:
+    state["_loaded_at"] = time.monotonic()
+    with _lock:
+        _sessions[state["sid"]] = state
+    return state
+
+
+def _sweep_cache():
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < SESSION_SWEEP_SECONDS:
+        return
+    _last_sweep = now
+    with _lock:
+        for sid in [sid for sid, s in _sessions.items() if s["expires_at"] <= now]:
+            del _sessions[sid]
+
+
+def _write(sql: str, params: tuple):
+    db = get_db()
+    try:
+        db.execute(sql, params)
+        db.commit()
+    finally:
+        db.close()
+
+
+# ==========================================
+# 🔹 Create / Lookup
+# ==========================================
+def create_session(user_id, device_id, risk_score, mode, expires_at: float, grants: dict = None) -> str:
+    sid = secrets.token_urlsafe(16)
+    state = {
+        "sid": sid,
+        "user_id": int(user_id),
+        "device_id": device_id,
+        "risk_score": float(risk_score or 0),
+        "mode": mode,
+        "grants": dict(grants or {}),
+        "revoked": False,
+        "expires_at": expires_at
+    }
+    _write(
+        """
+        INSERT INTO sessions (sid, user_id, device_id, risk_score, mode, grants,
+                              revoked, created_at, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)
+        """,
+        (sid, state["user_id"], device_id, state["risk_score"], mode,
+         json.dumps(state["grants"]), datetime.utcnow().isoformat(), expires_at)
+    )
+    _sweep_cache()
+    _cache(state)
+    metrics.incr("sessions.created")
+    return sid
+
+
+def mint_session_token(claims: dict, sid: str, request, expiry_minutes: int = None) -> str:
+    """Access token for an existing session, bound to the client fingerprint."""
+    return create_token(
+        {**claims, "sid": sid},
+        expiry_minutes=expiry_minutes,
+        fingerprint=request_fingerprint(request)
+    )
+
+
+def open_request_session(claims: dict, request, mode: str = "normal", expiry_minutes: int = None,
+                         grants: dict = None) -> str:
+    if expiry_minutes is None:
+        expiry_minutes = ACCESS_TOKEN_EXPIRE_MINUTES
+    ip = request.client.host
+    return create_session(
+        user_id=claims["sub"],
+        device_id=generate_device_id(request.headers.get("user-agent", ""), ip),
+        risk_score=claims.get("risk_score", 0),
+        mode=mode,
+        expires_at=time.time() + expiry_minutes * 60,
+        grants=grants
+    )
+
+
+def get_session(sid) -> dict | None:
+    """Live session state, or None if unknown or expired."""
+    state = _sessions.get(sid)
+    if state is not None and time.monotonic() - state["_loaded_at"] < SESSION_REVALIDATE_SECONDS:
+        if state["expires_at"] <= time.time():
+            with _lock:
+                _sessions.pop(sid, None)
+            return None
+        return state
+
+    db = get_db()
+    try:
+        row = db.execute("SELECT * FROM sessions WHERE sid=?", (sid,)).fetchone()
+    finally:
+        db.close()
+    if not row or row["expires_at"] <= time.time():
+        with _lock:
+            _sessions.pop(sid, None)
+        return None
+    return _cache(_row_to_state(row))
+
+
+def apply_session(payload: dict) -> dict | None:
+    """
+    Overlays the session's live risk and mode onto a verified token payload.
+    Returns None when the session was revoked or has expired. Tokens minted
+    before sessions existed (no sid) pass through unchanged.
+    """
+    sid = payload.get("sid")
+    if not sid:
+        return payload
+    state = get_session(sid)
+    if state is None or state["revoked"]:
+        metrics.incr("sessions.rejected")
+        return None
+    payload["risk_score"] = state["risk_score"]
+    payload["monitor"] = state["mode"] == "monitor"
+    return payload
+
+
+# ==========================================
+# 🔹 Step-up Grants
+# ==========================================
+def step_up_grant(level: str, resource: str = None, ttl_seconds: int = STEPUP_GRANT_TTL_SECONDS) -> dict:
+    """
+    A grant for completing `level` step-up, scoped to the resource class
+    that asked for it (or every resource, for step-up done at login).
+    """
+    key = resource_class(resource) if resource else ANY_RESOURCE
+    return {key: {"level": ASSURANCE_LEVELS[level], "expires_at": time.time() + ttl_seconds}}
+
+
+def has_step_up_grant(payload: dict, resource: str, action: str) -> bool:
+    """True when the session already completed step-up for `action` on `resource`."""
+    needed = ASSURANCE_LEVELS.get(action)
+    sid = payload.get("sid")
+    if needed is None or not sid:
+        return False
+    state = get_session(sid)
+    if state is None:
+        return False
+    now = time.time()
+    for key in (resource_class(resource), ANY_RESOURCE):
+        grant = state["grants"].get(key)
+        if grant and grant["level"] >= needed and grant["expires_at"] > now:
+            metrics.incr("sessions.grant_hits")
+            return True
+    return False
+
+
+# ==========================================
+# 🔹 Updates
+# ==========================================
+def update_session_risk(sid, risk_score, mode=None):
+    """Raises/lowers the session's risk; applies on the very next request."""
+    state = get_session(sid)
+    if state is None:
+        return
+    state["risk_score"] = float(risk_score)
+    if mode is not None:
+        state["mode"] = mode
+    _write(
+        "UPDATE sessions SET risk_score=?, mode=? WHERE sid=?",
+        (state["risk_score"], state["mode"], sid)
+    )
+
+
+def extend_session(sid, expires_at: float):
+    """Pushes the session's expiry out (token refresh)."""
+    state = get_session(sid)
+    if state is None:
+        return
+    state["expires_at"] = max(state["expires_at"], expires_at)
+    _write("UPDATE sessions SET expires_at=? WHERE sid=?", (state["expires_at"], sid))
+
+
+def revoke_session(sid):
+    _write("UPDATE sessions SET revoked=1 WHERE sid=?", (sid,))
+    state = _sessions.get(sid)
+    if state is not None:
+        state["revoked"] = True
+    metrics.incr("sessions.revoked")
+
+
+def revoke_user_sessions(user_id) -> int:
+    """Revokes every session of the user. Returns how many were live."""
+    return _revoke_where("user_id=?", (int(user_id),), lambda s: s["user_id"] == int(user_id))
+
+
+def revoke_device_sessions(device_id, user_id=None) -> int:
+    """Revokes every session opened from `device_id` (optionally one user's)."""
+    if user_id is None:
+        return _revoke_where("device_id=?", (device_id,), lambda s: s["device_id"] == device_id)
+    return _revoke_where(
+        "device_id=? AND user_id=?", (device_id, int(user_id)),
+        lambda s: s["device_id"] == device_id and s["user_id"] == int(user_id)
+    )
+
+
+def _revoke_where(where: str, params: tuple, match) -> int:
+    db = get_db()
+    try:
+        cur = db.execute(
+            f"UPDATE sessions SET revoked=1 WHERE {where} AND revoked=0 AND expires_at>?",
+            (*params, time.time())
+        )
+        db.commit()
+        count = cur.rowcount
+    finally:
+        db.close()
+
+    with _lock:
+        for state in _sessions.values():
+            if match(state):
+                state["revoked"] = True
+    metrics.incr("sessions.revoked", count)
+    return count
+
+
+def purge_expired_sessions() -> int:
+    db = get_db()
+    try:
+        cur = db.execute("DELETE FROM sessions WHERE expires_at<=?", (time.time(),))
+        db.commit()
+        removed = cur.rowcount
+    finally:
+        db.close()
+    global _last_sweep
+    _last_sweep = 0.0
+    _sweep_cache()
+    return removed
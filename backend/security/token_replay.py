@@ -0,0 +1,83 @@
+# backend/security/token_replay.py
+
+"""
+JWT replay detection.
+
+Every token carries a `jti`; access tokens minted with a request in hand
+also carry `dfp`, a short fingerprint of the client (user agent + /24 IP
+prefix). A token presented with a different fingerprint than the one it
+was bound to — or, for tokens without `dfp`, than the one it was first
+seen with — is a replay: the flag feeds the `token_replay` critical
+override.
+
+First-seen fingerprints live in buckets keyed by the token's expiry
+minute. A lookup touches exactly one bucket (O(1)); whole buckets are
+dropped once their minute has passed, so memory is bounded by the tokens
+still alive.
+"""
+
+import hashlib
+import threading
+import time
+
+from backend import metrics
+from backend.behavior.metadata_collector import extract_ip_prefix
+
+
+SEEN_BUCKET_SECONDS = 60
+
+
+def request_fingerprint(request) -> str:
+    """Client binding for tokens: user agent + /24 prefix of the source IP."""
+    ip = request.client.host if request.client else ""
+    return client_fingerprint(ip, request.headers.get("user-agent", ""))
+
+
+def client_fingerprint(ip: str, user_agent: str) -> str:
+    raw = f"{user_agent}|{extract_ip_prefix(ip) or ip}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+class TokenSeenStore:
+
+    def __init__(self, bucket_seconds=SEEN_BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self._buckets = {}      # expiry bucket -> {jti: fingerprint}
+        self._purged_through = 0
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        current = int(now // self.bucket_seconds)
+        if current <= self._purged_through:
+            return
+        for bucket in [b for b in self._buckets if b < current]:
+            del self._buckets[bucket]
+        self._purged_through = current
+
+    def first_seen(self, jti, exp, fingerprint) -> str:
+        """Records `fingerprint` for `jti` if new; returns the first one seen."""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            bucket = self._buckets.setdefault(int(exp // self.bucket_seconds), {})
+            return bucket.setdefault(jti, fingerprint)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(b) for b in self._buckets.values())
+
+
+seen_tokens = TokenSeenStore()
+
+
+def is_replay(payload: dict, fingerprint: str) -> bool:
+    """True when the token is presented from a client it was not bound to."""
+    jti = payload.get("jti")
+    if not jti or not fingerprint:
+        # Tokens minted before jti existed can't be tracked.
+        return False
+    expected = payload.get("dfp") or seen_tokens.first_seen(jti, payload.get("exp", 0), fingerprint)
+    if expected != fingerprint:
+        metrics.incr("tokens.replay_detected")
+        return True
+    return False
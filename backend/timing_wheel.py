@@ -0,0 +1,109 @@
+# backend/timing_wheel.py
+
+"""
+In-memory key/value store with per-entry TTL, expired by a timing wheel.
+
+Entries hash into one of `slots` buckets by expiry tick. Each access first
+advances the wheel to the current tick and drops everything in the buckets
+it passed, so expiry costs O(expired entries) instead of a full scan, and
+no background task is needed. Entries whose TTL is longer than one wheel
+revolution are simply re-filed when their bucket comes round early.
+
+Thread-safe: sync FastAPI routes run on the threadpool.
+"""
+
+import math
+import threading
+import time
+
+
+class TTLStore:
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 512, clock=time.monotonic):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self._clock = clock
+        self._buckets = [set() for _ in range(slots)]
+        self._entries = {}          # key -> (value, expires_at)
+        self._tick = self._now_tick()
+        self._lock = threading.Lock()
+
+    def _now_tick(self) -> int:
+        return int(self._clock() // self.tick_seconds)
+
+    def _advance(self):
+        now_tick = self._now_tick()
+        if now_tick <= self._tick:
+            return
+        now = self._clock()
+        # Never walk more than one revolution: every bucket is visited once.
+        for tick in range(self._tick + 1, min(now_tick, self._tick + self.slots) + 1):
+            bucket = self._buckets[tick % self.slots]
+            if not bucket:
+                continue
+            for key in list(bucket):
+                entry = self._entries.get(key)
+                if entry is None:
+                    bucket.discard(key)
+                elif entry[1] <= now:
+                    bucket.discard(key)
+                    del self._entries[key]
+                elif math.ceil(entry[1] / self.tick_seconds) % self.slots != tick % self.slots:
+                    # Filed here after an overwrite with a new expiry.
+                    bucket.discard(key)
+        self._tick = now_tick
+
+    def _file(self, key, expires_at):
+        self._buckets[math.ceil(expires_at / self.tick_seconds) % self.slots].add(key)
+
+    def set(self, key, value, ttl_seconds: float):
+        with self._lock:
+            self._advance()
+            expires_at = self._clock() + ttl_seconds
+            self._entries[key] = (value, expires_at)
+            self._file(key, expires_at)
+
+    def add(self, key, value, ttl_seconds: float) -> bool:
+        """Sets `key` only if absent (or expired). Returns True if it was set."""
+        with self._lock:
+            self._advance()
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > self._clock():
+                return False
+            expires_at = self._clock() + ttl_seconds
+            self._entries[key] = (value, expires_at)
+            self._file(key, expires_at)
+            return True
+
+    def get(self, key, default=None):
+        with self._lock:
+            self._advance()
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self._clock():
+                return default
+            return entry[0]
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            # Its bucket slot is cleaned up lazily when the wheel passes it.
+            if entry is None or entry[1] <= self._clock():
+                return default
+            return entry[0]
+
+    def ttl(self, key) -> float:
+        """Seconds left for `key`, 0 if absent/expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return max(entry[1] - self._clock(), 0.0) if entry else 0.0
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            self._advance()
+            return len(self._entries)
+
+
+_MISSING = object()